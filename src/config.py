@@ -12,8 +12,14 @@ DATA_DIR = PROJECT_ROOT / "dat"
 RAW_DIR = DATA_DIR / "raw"
 RAW_BORROWINGS_DIR = RAW_DIR / "borrowings"
 CLOSED_DAYS_FILE = RAW_DIR / "closed_days.csv"
+USER_CATEGORIES_FILE = RAW_DIR / "Benutzerkategorien.xlsx"
+COLLECTION_CODES_FILE = RAW_DIR / "Sammlungszeichen_CCODE.xlsx"
 
 PROCESSED_DIR = DATA_DIR / "processed"
+INGEST_CACHE_DIR = PROCESSED_DIR / "ingest_cache"  # typed parquet copy of each raw year file
+LOOKUP_CACHE_DIR = PROCESSED_DIR / "lookup_cache"  # parquet copy of the xlsx lookup tables
+FEATURE_CACHE_DIR = PROCESSED_DIR / "feature_cache"  # feature columns per input data key (add_features)
+SWEEP_DIR = PROCESSED_DIR / "sweeps"  # cleaning threshold sweeps (--sweep), independent of any version
 
 REPORTS_DIR = PROJECT_ROOT / "doc" / "report"
 FIGURES_DIR = REPORTS_DIR / "figures"
@@ -53,6 +59,13 @@ SOURCE_YEAR_COL = "source_year"
 
 # closed days/calender rules
 CLOSED_DATE_COL = "schliesstag"
+# branch code, keys closed_days.csv; used per loan too if the export has this column
+BRANCH_COL = "Zweigstelle"
+
+# lookup tables (xlsx)
+USER_CATEGORY_DESC_COL = "user_category_description"
+USER_CATEGORY_GROUP_COL = "user_category_group"
+COLLECTION_CODE_DESC_COL = "collection_code_description"
 
 
 # Preprocessing
@@ -60,11 +73,30 @@ CLOSED_DATE_COL = "schliesstag"
 # library open days: Tue–Sat (Mon..Sun: 0,1,1,1,1,1,0)
 LIB_WEEKMASK = "0111110"
 
+# candidate formats of the raw timestamp strings (detected per source file)
+RAW_TIMESTAMP_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y %H:%M",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%d.%m.%Y",
+)
+
 REMOVE_USER_CATEGORIES = {"MDA", "MZUZL", "SYS"}
 
 BASE_ALLOWED_OPEN_DAYS = 28 # base allowed open days for loan duration calculation
 MAX_EXTENSIONS_CAP = 6 # rule of the libary for max extensions
 
+# threshold grids evaluated by `python -m src.main --sweep`
+SWEEP_BASE_ALLOWED_OPEN_DAYS = (21, 28, 35, 42)
+SWEEP_MAX_EXTENSIONS_CAP = (3, 6, 9)
+SWEEP_REMOVE_USER_CATEGORIES = (
+    {"MDA", "MZUZL", "SYS"},
+    {"MDA", "SYS"},
+    set(),
+)
+
 # Derived / feature columns
 LATE_FLAG_COL = "late_flag"
 
@@ -75,7 +107,13 @@ SESSION_SIZE_COL = "session_size"
 SESSION_LATE_FLAG_COL = "session_late_flag"
 SESSION_EXTENSION_FLAG_COL = "session_extension_flag"
 EXPERIENCE_STAGE_COL = "experience_stage"
-SESSION_CATEGORY_COL = "session_category"
+SESSION_CATEGORY_COL = "session_category"  # dominant media type of a session (unique max)
+SESSION_MEDIA_TIE_COL = "session_media_tie"  # no unique dominant media type
+SESSION_N_MEDIA_TYPES_COL = "session_n_media_types"
+
+# session policy: None = one session per calendar day,
+# N = a new session starts after more than N minutes without a loan (e.g. 30)
+SESSION_GAP_MINUTES: int | None = None
 
 # timing features
 WEEKDAY_COL = "weekday"
@@ -91,6 +129,11 @@ PRECISE_HOUR_COL = "precise_hour"
 USER_AVG_HOUR_COL = "user_mean_hour"
 USER_STD_HOUR_COL = "user_std_hour"
 
+# user table (one row per user, see features.build_user_table)
+USER_N_SESSIONS_COL = "user_n_sessions"
+USER_N_LOANS_COL = "user_n_loans"
+USER_FREQUENT_COL = "user_frequent"
+
 
 
 
@@ -100,6 +143,7 @@ USER_STD_HOUR_COL = "user_std_hour"
 EXPERIENCE_CUTOFF = 3          # early vs experienced threshold (session_index <= 3)
 MAX_SESSION_INDEX_PLOT = 25    # cap x-axis to avoid long tail dominating
 LEARNING_CURVE_SMOOTHING = 3  # moving average window size for learning curve plot
+MIN_FREQUENT_USER_SESSIONS = 10  # users with at least this many sessions count as frequent (user statistics)
 
 # For plot 2:
 
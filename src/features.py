@@ -1,7 +1,20 @@
 # src/features.py
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import tempfile
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
 
 from src.config import (
     ISSUE_COL,
@@ -24,82 +37,291 @@ from src.config import (
     PRECISE_HOUR_COL,
     USER_AVG_HOUR_COL,
     USER_STD_HOUR_COL,
+    USER_CATEGORY_COL,
+    USER_CATEGORY_DESC_COL,
+    USER_CATEGORY_GROUP_COL,
+    COLLECTION_CODE_COL,
+    COLLECTION_CODE_DESC_COL,
+    MEDIA_TYPE_COL,
+    SOURCE_YEAR_COL,
+    SESSION_CATEGORY_COL,
+    SESSION_MEDIA_TIE_COL,
+    SESSION_N_MEDIA_TYPES_COL,
+    USER_N_SESSIONS_COL,
+    USER_N_LOANS_COL,
+    USER_FREQUENT_COL,
+    MIN_FREQUENT_USER_SESSIONS,
+    SESSION_GAP_MINUTES,
 )
+from src.schema import FEATURE_SCHEMA, SESSION_SCHEMA, USER_SCHEMA, apply_schema
 
 
-def add_features(df: pd.DataFrame) -> pd.DataFrame:
+def _decode_categorical(codes: pd.Series, keys: pd.Series, values: pd.Series) -> pd.Series:
     """
-    Add analysis-ready features to the cleaned borrowings dataset.
+    Map a code column to the values of a lookup table (keys -> values).
+
+    Works on the categories of the code column (stripped, matched once per distinct
+    code) and then remaps the integer category codes, so no string join over all rows.
+    Unknown or missing codes become NaN.
     """
-    df = df.copy()
+    codes = codes.astype("category")
+    value_cats = pd.Index(values.dropna().unique())
 
-    # --- item-level late flag ---
-    df[LATE_FLAG_COL] = df[LATE_COL].astype(bool)
+    # per code category: position of its value in value_cats (-1 = unknown)
+    pos_in_lookup = pd.Index(keys).get_indexer(codes.cat.categories.astype(str).str.strip())
+    cat_to_value = np.where(
+        pos_in_lookup >= 0,
+        value_cats.get_indexer(values.to_numpy()[pos_in_lookup]),
+        -1,
+    )
 
-    # --- user-based features (only where user id exists) ---
-    has_user = df[USER_ID_COL].notna()
+    row_codes = codes.cat.codes.to_numpy()
+    new_codes = np.where(row_codes >= 0, cat_to_value[row_codes], -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories=value_cats), index=codes.index)
 
-    # issue session (calendar day)
-    df.loc[has_user, ISSUE_SESSION_COL] = (
-        df.loc[has_user, ISSUE_COL].dt.floor("D")
-    )
 
-    # session index per user
-    df.loc[has_user, SESSION_INDEX_COL] = (
-        df.loc[has_user]
-        .groupby(USER_ID_COL)[ISSUE_SESSION_COL]
-        .transform(lambda s: pd.factorize(s, sort=True)[0] + 1)
-    )
+def add_lookup_columns(
+    df: pd.DataFrame,
+    *,
+    user_categories: pd.DataFrame,
+    collection_codes: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Decode USER_CATEGORY_COL and COLLECTION_CODE_COL with the xlsx lookup tables
+    (see io.load_user_categories / io.load_collection_codes). Adds categorical
+    description/group columns in place and returns df.
+    """
+    if USER_CATEGORY_COL in df.columns:
+        for col in (USER_CATEGORY_DESC_COL, USER_CATEGORY_GROUP_COL):
+            df[col] = _decode_categorical(
+                df[USER_CATEGORY_COL], user_categories[USER_CATEGORY_COL], user_categories[col]
+            )
 
-    # session size
-    df.loc[has_user, SESSION_SIZE_COL] = (
-        df.loc[has_user]
-        .groupby([USER_ID_COL, ISSUE_SESSION_COL])[ISSUE_SESSION_COL]
-        .transform("size")
-    )
+    if COLLECTION_CODE_COL in df.columns:
+        df[COLLECTION_CODE_DESC_COL] = _decode_categorical(
+            df[COLLECTION_CODE_COL],
+            collection_codes[COLLECTION_CODE_COL],
+            collection_codes[COLLECTION_CODE_DESC_COL],
+        )
+
+    return df
+
+
+def _session_order(
+    users: np.ndarray,
+    keys: np.ndarray,
+    max_gap: int = 0,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort rows by (user, key) once and mark the session boundaries: a new session starts
+    at a new user or where the key grows by more than max_gap over the previous row.
+    Returns (order, new_user, starts, session_id), all but order in sorted row order:
+    new_user/starts mark the first row of each user/session, session_id numbers the
+    sessions 0..n_sessions-1.
+    """
+    n = len(users)
+    order = np.lexsort((keys, users))
+    u = users[order]
+    k = keys[order]
+
+    new_user = np.ones(n, dtype=bool)
+    new_user[1:] = u[1:] != u[:-1]
+    new_session = new_user.copy()
+    new_session[1:] |= (k[1:] - k[:-1]) > max_gap
+
+    return order, new_user, np.flatnonzero(new_session), np.cumsum(new_session) - 1
+
+
+def _sessions(
+    users: np.ndarray,
+    keys: np.ndarray,
+    *flags: np.ndarray,
+    max_gap: int = 0,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[np.ndarray]]:
+    """
+    Sessions without groupby: one lexsort by (user, key), session boundaries from the
+    neighbour differences (see _session_order) and cumsum for the numbering.
+
+    users: integer user codes, keys: integer sort keys (day numbers or timestamps, see
+    _session_keys), flags: bool arrays (all per row).
+    Returns per row (session index within the user starting at 1 in time order,
+    session size, key of the session's first row, [any(flag) over the session for each flag]).
+    """
+    n = len(users)
+    if n == 0:
+        empty = np.zeros(0, dtype="int64")
+        return empty, empty, empty, [np.zeros(0, dtype=bool) for _ in flags]
 
-    # session-level late flag
-    df.loc[has_user, SESSION_LATE_FLAG_COL] = (
-        df.loc[has_user]
-        .groupby([USER_ID_COL, ISSUE_SESSION_COL])[LATE_FLAG_COL]
-        .transform("any")
+    order, new_user, starts, session_id = _session_order(users, keys, max_gap)
+    user_first_session = session_id[new_user][np.cumsum(new_user) - 1]
+
+    index_sorted = session_id - user_first_session + 1
+    size_sorted = np.diff(np.append(starts, n))[session_id]
+    start_sorted = keys[order][starts][session_id]
+    flags_sorted = [np.logical_or.reduceat(f[order], starts)[session_id] for f in flags]
+
+    def unsort(values: np.ndarray) -> np.ndarray:
+        out = np.empty_like(values)
+        out[order] = values
+        return out
+
+    return (
+        unsort(index_sorted),
+        unsort(size_sorted),
+        unsort(start_sorted),
+        [unsort(f) for f in flags_sorted],
     )
 
-    # session-level extension flag
-    df.loc[has_user, SESSION_EXTENSION_FLAG_COL] = (
-        df.loc[has_user]
-        .groupby([USER_ID_COL, ISSUE_SESSION_COL])[EXTENSIONS_COL]
-        .transform(lambda s: (s > 0).any())
+
+def _day_numbers(s: pd.Series) -> np.ndarray:
+    # datetime (floored to the day) -> integer day number
+    return s.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype("int64")
+
+
+def _session_keys(issue: pd.Series, gap_minutes: int | None) -> tuple[np.ndarray, int]:
+    """
+    Sort keys and max_gap for _sessions under a session policy:
+    gap_minutes=None -> one session per calendar day (day numbers, max_gap 0),
+    otherwise a new session after more than gap_minutes without a loan (nanoseconds).
+    """
+    if gap_minutes is None:
+        return _day_numbers(issue), 0
+    return issue.to_numpy(dtype="datetime64[ns]").astype("int64"), int(gap_minutes) * 60 * 10**9
+
+
+def _session_start(start_keys: np.ndarray, gap_minutes: int | None) -> np.ndarray:
+    # session start keys from _sessions -> ISSUE_SESSION_COL (day, or issue time of the first loan)
+    unit = "datetime64[D]" if gap_minutes is None else "datetime64[ns]"
+    return start_keys.astype(unit).astype("datetime64[ns]")
+
+
+def _count_matrix(codes: np.ndarray, values: np.ndarray, n_rows: int, n_values: int) -> np.ndarray:
+    """
+    counts[i, v] = number of rows with codes == i and values == v.
+    """
+    flat = np.bincount(codes * n_values + values, minlength=n_rows * n_values)
+    return flat.reshape(n_rows, n_values)
+
+
+# --------------------------------------------------
+# Feature graph
+# --------------------------------------------------
+
+@dataclass(frozen=True)
+class FeatureNode:
+    """
+    A feature step: compute(df, has_user, **params) adds the `outputs` columns to df in
+    place and may only read the `inputs` columns (raw columns or outputs of earlier
+    nodes). `params` names the add_features keyword arguments it takes.
+    """
+    name: str
+    outputs: tuple[str, ...]
+    inputs: tuple[str, ...]
+    compute: Callable[..., None]
+    params: tuple[str, ...] = ()
+
+
+# row position column of the shards in _compute_sharded
+SHARD_ROW_COL = "_row"
+
+# sources whose content determines the feature values (part of the feature cache key):
+# the nodes read thresholds from config.py, the output dtypes come from schema.py
+FEATURE_SOURCE_FILES = ("features.py", "config.py", "schema.py")
+
+# nodes in registration order, which is a valid computation order
+FEATURE_NODES: dict[str, FeatureNode] = {}
+# output column -> name of the node computing it
+FEATURE_PRODUCERS: dict[str, str] = {}
+
+
+def register_feature(
+    name: str,
+    outputs: Iterable[str],
+    inputs: Iterable[str],
+    *,
+    params: Iterable[str] = (),
+):
+    """
+    Decorator: add a compute function to FEATURE_NODES. Inputs computed by other nodes
+    must be registered before.
+    """
+    def decorator(fn: Callable[..., None]):
+        node = FeatureNode(name, tuple(outputs), tuple(inputs), fn, tuple(params))
+        if name in FEATURE_NODES or any(col in FEATURE_PRODUCERS for col in node.outputs):
+            raise ValueError(f"duplicate feature node or output: {name}")
+        FEATURE_NODES[name] = node
+        for col in node.outputs:
+            FEATURE_PRODUCERS[col] = name
+        return fn
+
+    return decorator
+
+
+@register_feature("late_flag", [LATE_FLAG_COL], [LATE_COL])
+def _feature_late_flag(df: pd.DataFrame, has_user: pd.Series) -> None:
+    # item-level late flag
+    df[LATE_FLAG_COL] = df[LATE_COL].astype(bool)
+
+
+@register_feature(
+    "sessions",
+    [ISSUE_SESSION_COL, SESSION_INDEX_COL, SESSION_SIZE_COL, SESSION_LATE_FLAG_COL, SESSION_EXTENSION_FLAG_COL],
+    [USER_ID_COL, ISSUE_COL, LATE_FLAG_COL, EXTENSIONS_COL],
+    params=["session_gap_minutes"],
+)
+def _feature_sessions(df: pd.DataFrame, has_user: pd.Series, session_gap_minutes: int | None) -> None:
+    # sessions: index per user (in time order), size, start, late / extension flags
+    df_u = df.loc[has_user]
+    keys, max_gap = _session_keys(df_u[ISSUE_COL], session_gap_minutes)
+    index, size, start, (late, ext) = _sessions(
+        pd.factorize(df_u[USER_ID_COL])[0],
+        keys,
+        df_u[LATE_FLAG_COL].to_numpy(dtype=bool),
+        df_u[EXTENSIONS_COL].gt(0).to_numpy(dtype=bool),
+        max_gap=max_gap,
     )
+    df.loc[has_user, ISSUE_SESSION_COL] = _session_start(start, session_gap_minutes)
+    df.loc[has_user, SESSION_INDEX_COL] = index
+    df.loc[has_user, SESSION_SIZE_COL] = size
+    df.loc[has_user, SESSION_LATE_FLAG_COL] = late
+    df.loc[has_user, SESSION_EXTENSION_FLAG_COL] = ext
+
 
-    # experience stage
+@register_feature("experience_stage", [EXPERIENCE_STAGE_COL], [SESSION_INDEX_COL])
+def _feature_experience_stage(df: pd.DataFrame, has_user: pd.Series) -> None:
     df.loc[has_user, EXPERIENCE_STAGE_COL] = (
         df.loc[has_user, SESSION_INDEX_COL]
         .le(EXPERIENCE_CUTOFF)
         .map({True: "early", False: "experienced"})
     )
 
-    # --- timing features ---
+
+@register_feature("timing", [WEEKDAY_COL, HOUR_COL], [USER_ID_COL, ISSUE_COL])
+def _feature_timing(df: pd.DataFrame, has_user: pd.Series) -> None:
     df.loc[has_user, WEEKDAY_COL] = df.loc[has_user, ISSUE_COL].dt.weekday
     df.loc[has_user, HOUR_COL] = df.loc[has_user, ISSUE_COL].dt.hour
 
-    # per-user typical time (mode)
-    user_modal = (
-        df.loc[has_user, [USER_ID_COL, WEEKDAY_COL, HOUR_COL]]
-        .groupby(USER_ID_COL)
-        .agg(
-            **{
-                USER_MODAL_WEEKDAY_COL: (WEEKDAY_COL, lambda s: s.mode().iloc[0]),
-                USER_MODAL_HOUR_COL: (HOUR_COL, lambda s: s.mode().iloc[0]),
-            }
-        )
-    )
-    df = df.merge(user_modal, on=USER_ID_COL, how="left")
 
-    df[USER_MATCH_TYPICAL_COL] = (
-        (df[WEEKDAY_COL] == df[USER_MODAL_WEEKDAY_COL]) &
-        (df[HOUR_COL] == df[USER_MODAL_HOUR_COL])
+@register_feature("typical_time", [USER_MATCH_TYPICAL_COL], [USER_ID_COL, WEEKDAY_COL, HOUR_COL])
+def _feature_typical_time(df: pd.DataFrame, has_user: pd.Series) -> None:
+    # per-user typical time (mode): (user x value) histograms, argmax = lowest value on ties.
+    # Only the per-loan match is stored here, the user-level values go to the user table
+    # (build_user_table).
+    user_codes, users = pd.factorize(df.loc[has_user, USER_ID_COL])
+    weekday = df.loc[has_user, WEEKDAY_COL].to_numpy(dtype="int64")
+    hour = df.loc[has_user, HOUR_COL].to_numpy(dtype="int64")
+    modal_weekday = _count_matrix(user_codes, weekday, len(users), 7).argmax(axis=1)
+    modal_hour = _count_matrix(user_codes, hour, len(users), 24).argmax(axis=1)
+
+    df[USER_MATCH_TYPICAL_COL] = False
+    df.loc[has_user, USER_MATCH_TYPICAL_COL] = (
+        (weekday == modal_weekday[user_codes]) &
+        (hour == modal_hour[user_codes])
     )
+
+
+@register_feature("precise_hour", [PRECISE_HOUR_COL], [USER_ID_COL, ISSUE_COL])
+def _feature_precise_hour(df: pd.DataFrame, has_user: pd.Series) -> None:
     # precise hour (hour + minutes/60 + seconds/3600)
     df.loc[has_user, PRECISE_HOUR_COL] = (
         df.loc[has_user, ISSUE_COL].dt.hour + 
@@ -107,18 +329,550 @@ def add_features(df: pd.DataFrame) -> pd.DataFrame:
         df.loc[has_user, ISSUE_COL].dt.second / 3600
     )
 
-    # per-user mean and std of precise hour
-    user_stats = (
-        df.loc[has_user, [USER_ID_COL, PRECISE_HOUR_COL]]
-        .groupby(USER_ID_COL)
-        .agg(
-            **{
-                USER_AVG_HOUR_COL:(PRECISE_HOUR_COL, "mean"),
-                USER_STD_HOUR_COL:(PRECISE_HOUR_COL, "std")
-            }
-        )
+
+def _required_nodes(columns: Iterable[str]) -> list[FeatureNode]:
+    """
+    Nodes needed for the requested feature columns, in computation order.
+    """
+    needed: set[str] = set()
+    stack = list(columns)
+    while stack:
+        col = stack.pop()
+        if col not in FEATURE_PRODUCERS:
+            raise KeyError(f"unknown feature column: {col}")
+        name = FEATURE_PRODUCERS[col]
+        if name not in needed:
+            needed.add(name)
+            stack.extend(c for c in FEATURE_NODES[name].inputs if c in FEATURE_PRODUCERS)
+    return [node for name, node in FEATURE_NODES.items() if name in needed]
+
+
+def _feature_cache_key(df: pd.DataFrame, params: dict) -> str:
+    """
+    Cache key of a feature frame: hash of the raw columns the graph reads (row by row,
+    index ignored), the parameters and the FEATURE_SOURCE_FILES.
+    """
+    raw_cols = sorted(
+        {c for node in FEATURE_NODES.values() for c in node.inputs if c not in FEATURE_PRODUCERS}
     )
-    df = df.merge(user_stats, on=USER_ID_COL, how="left")
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(df[raw_cols], index=False).to_numpy().tobytes())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    src_dir = Path(__file__).resolve().parent
+    for name in FEATURE_SOURCE_FILES:
+        h.update((src_dir / name).read_bytes())
+    return h.hexdigest()[:16]
 
 
+def _concat_rows(parts: list[pd.DataFrame], **kwargs) -> pd.DataFrame:
+    """
+    pd.concat without the empty parts (pandas warns that they will affect the result
+    dtypes); if all parts are empty, the first one is returned. Categorical columns
+    get the union of their categories first (in place), so an all-NA part (which has
+    none) does not change the result dtype either.
+    """
+    non_empty = [part for part in parts if len(part)] or parts[:1]
+    for col in non_empty[0].columns:
+        columns = [part[col] for part in non_empty if col in part.columns]
+        if len(columns) > 1 and all(isinstance(c.dtype, pd.CategoricalDtype) for c in columns):
+            categories = union_categoricals(columns, ignore_order=True).categories
+            for part in non_empty:
+                part[col] = part[col].cat.set_categories(categories)
+    return pd.concat(non_empty, **kwargs)
+
+
+def _write_ipc(df: pd.DataFrame, path: Path) -> None:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_ipc(path: Path) -> pd.DataFrame:
+    # memory-mapped: the column buffers are shared with the page cache, not copied through a pipe
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def _compute_shard(in_path: Path, out_path: Path, node_names: list[str], params: dict) -> None:
+    """
+    Worker: run the given feature nodes on one user shard (Arrow IPC file) and write
+    their output columns (plus the row position column) to out_path.
+    """
+    df = _read_ipc(in_path)
+    has_user = df[USER_ID_COL].notna()
+    outputs = [SHARD_ROW_COL]
+    for name in node_names:
+        node = FEATURE_NODES[name]
+        node.compute(df, has_user, **{p: params[p] for p in node.params})
+        outputs.extend(node.outputs)
+    _write_ipc(apply_schema(df[outputs].copy(), FEATURE_SCHEMA), out_path)
+
+
+def _compute_sharded(df: pd.DataFrame, nodes: list[FeatureNode], params: dict, workers: int) -> None:
+    """
+    Run nodes on df in a process pool, in place: loans are hash-partitioned by user into
+    one shard per worker (every node works per user or per row, so shards are independent).
+    Shards travel as Arrow IPC files with only the columns the nodes read.
+    """
+    inputs = sorted({c for node in nodes for c in node.inputs if c in df.columns} | {USER_ID_COL})
+    user_ids = df[USER_ID_COL].to_numpy(dtype="float64", na_value=np.nan)
+    has_user = ~np.isnan(user_ids)
+    shard = np.arange(len(df)) % workers  # loans without user: round robin
+    shard[has_user] = pd.util.hash_array(user_ids[has_user].astype("int64")) % workers
+
+    print(f"[features] computing {len(nodes)} feature nodes in {workers} user shards")
+    with tempfile.TemporaryDirectory(prefix="features_") as tmp:
+        tmp_dir = Path(tmp)
+        in_paths = [tmp_dir / f"in_{i}.arrow" for i in range(workers)]
+        out_paths = [tmp_dir / f"out_{i}.arrow" for i in range(workers)]
+        for i, path in enumerate(in_paths):
+            rows = np.flatnonzero(shard == i)
+            part = df[inputs].take(rows).reset_index(drop=True)
+            part[SHARD_ROW_COL] = rows
+            _write_ipc(part, path)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_compute_shard, in_paths, out_paths, repeat([n.name for n in nodes]), repeat(params)))
+
+        out = _concat_rows([_read_ipc(path) for path in out_paths], ignore_index=True)
+
+    # every row is in exactly one shard: sorting by position restores df's row order
+    out = out.take(np.argsort(out[SHARD_ROW_COL].to_numpy(), kind="stable"))
+    for col in out.columns.drop(SHARD_ROW_COL):
+        df[col] = out[col].set_axis(df.index)
+
+
+def add_features(
+    df: pd.DataFrame,
+    *,
+    columns: Iterable[str] | None = None,
+    session_gap_minutes: int | None = SESSION_GAP_MINUTES,
+    cache_dir: Path | None = None,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Add analysis-ready features to the cleaned borrowings dataset.
+    Row order and index of df are kept. The result is cast to FEATURE_SCHEMA (src/schema.py).
+
+    columns: feature columns to compute (default: all). Only the nodes they depend on
+    run; their intermediate columns are kept in the result.
+
+    session_gap_minutes selects the session policy: None = one session per calendar day
+    (ISSUE_SESSION_COL is the day), N = a new session after more than N minutes without
+    a loan (ISSUE_SESSION_COL is the issue time of the session's first loan).
+
+    cache_dir: if given, each computed node's columns are stored there under a key of the
+    input data, parameters and feature code, and reused by later calls with the same key.
+
+    workers > 1 computes the features in that many user shards in a process pool
+    (workers = 0 uses one process per CPU).
+    """
+    df = df.copy()
+    nodes = list(FEATURE_NODES.values()) if columns is None else _required_nodes(columns)
+    params = {"session_gap_minutes": session_gap_minutes}
+
+    node_dir = None
+    if cache_dir is not None:
+        node_dir = Path(cache_dir) / _feature_cache_key(df, params)
+        node_dir.mkdir(parents=True, exist_ok=True)
+
+    # --- user-based features only where user id exists ---
+    has_user = df[USER_ID_COL].notna()
+
+    missing = []
+    for node in nodes:
+        path = node_dir / f"{node.name}.parquet" if node_dir is not None else None
+        if path is not None and path.exists():
+            cached = pd.read_parquet(path)
+            for col in node.outputs:
+                df[col] = cached[col].set_axis(df.index)
+        else:
+            missing.append(node)
+
+    if node_dir is not None and len(missing) < len(nodes):
+        reused = [node.name for node in nodes if node not in missing]
+        print(f"[features] reused cached features: {', '.join(reused)}")
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if missing and workers > 1:
+        _compute_sharded(df, missing, params, workers)
+    else:
+        for node in missing:
+            node.compute(df, has_user, **{name: params[name] for name in node.params})
+
+    if node_dir is not None:
+        for node in missing:
+            out = apply_schema(df[list(node.outputs)].reset_index(drop=True), FEATURE_SCHEMA)
+            out.to_parquet(node_dir / f"{node.name}.parquet")
+
+    # compact dtypes (the .loc assignments above leave float64/object columns)
+    return apply_schema(df, FEATURE_SCHEMA, report="features")
+
+
+# --------------------------------------------------
+# Session table (one row per user-session)
+# --------------------------------------------------
+
+def _dominant_media(
+    session_id: np.ndarray,
+    media_codes: np.ndarray,
+    n_sessions: int,
+    n_media: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per session: code of the unique most frequent media type (-1 if tied or none),
+    tie flag and number of distinct media types. Rows with code -1 are ignored.
+    """
+    valid = media_codes >= 0
+    pairs, counts = np.unique(
+        session_id[valid].astype("int64") * n_media + media_codes[valid], return_counts=True
+    )
+    pair_session = pairs // n_media
+    pair_media = pairs % n_media
+
+    n_types = np.bincount(pair_session, minlength=n_sessions)
+    max_n = np.zeros(n_sessions, dtype="int64")
+    if len(pairs):
+        # pairs are sorted by session: segment max per session
+        seg = np.flatnonzero(np.r_[True, pair_session[1:] != pair_session[:-1]])
+        max_n[pair_session[seg]] = np.maximum.reduceat(counts, seg)
+
+    is_max = counts == max_n[pair_session]
+    n_at_max = np.bincount(pair_session[is_max], minlength=n_sessions)
+
+    dominant = np.full(n_sessions, -1, dtype="int64")
+    unique_max = is_max & (n_at_max[pair_session] == 1)
+    dominant[pair_session[unique_max]] = pair_media[unique_max]
+    return dominant, n_at_max > 1, n_types
+
+
+def build_session_table(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Collapse a feature frame to one row per user-session, sorted by user and session index.
+
+    Columns: USER_ID_COL, ISSUE_SESSION_COL, SESSION_INDEX_COL and (if present in df)
+    SOURCE_YEAR_COL, SESSION_SIZE_COL and the session flags. From MEDIA_TYPE_COL:
+    SESSION_CATEGORY_COL (unique most frequent media type, NaN on ties),
+    SESSION_MEDIA_TIE_COL and SESSION_N_MEDIA_TYPES_COL; loans without media type
+    are ignored there. Shared by validation, stats and plots instead of each of them
+    deduplicating / grouping the loans again.
+    """
+    df_u = df.loc[df[USER_ID_COL].notna() & df[ISSUE_SESSION_COL].notna()]
+    # ISSUE_SESSION_COL identifies the session under either session policy
+    order, _, starts, session_id = _session_order(
+        df_u[USER_ID_COL].to_numpy(dtype="int64"),
+        df_u[ISSUE_SESSION_COL].to_numpy(dtype="datetime64[ns]").astype("int64"),
+    )
+
+    cols = [
+        col
+        for col in (
+            USER_ID_COL,
+            ISSUE_SESSION_COL,
+            SOURCE_YEAR_COL,
+            SESSION_INDEX_COL,
+            SESSION_SIZE_COL,
+            SESSION_LATE_FLAG_COL,
+            SESSION_EXTENSION_FLAG_COL,
+        )
+        if col in df_u.columns
+    ]
+    sessions = df_u[cols].take(order[starts]).reset_index(drop=True)
+
+    if MEDIA_TYPE_COL in df_u.columns:
+        media = df_u[MEDIA_TYPE_COL].astype("category")
+        categories = media.cat.categories
+        dominant, tie, n_types = _dominant_media(
+            session_id, media.cat.codes.to_numpy()[order], len(starts), len(categories)
+        )
+        sessions[SESSION_CATEGORY_COL] = pd.Categorical.from_codes(dominant, categories=categories)
+        sessions[SESSION_MEDIA_TIE_COL] = tie
+        sessions[SESSION_N_MEDIA_TYPES_COL] = n_types
+
+    return apply_schema(sessions, SESSION_SCHEMA)
+
+
+# --------------------------------------------------
+# Incremental updates (new loans appended to an existing processed version)
+# --------------------------------------------------
+
+# per-user running state persisted next to the processed data
+STATE_N_SESSIONS = "n_sessions"
+STATE_LAST_SESSION = "last_session"
+STATE_LAST_SESSION_SIZE = "last_session_size"
+STATE_LAST_SESSION_LATE = "last_session_late"
+STATE_LAST_SESSION_EXT = "last_session_extension"
+STATE_N_HOUR = "n_precise_hour"
+STATE_MEAN_HOUR = "mean_precise_hour"
+STATE_M2_HOUR = "m2_precise_hour"  # sum of squared deviations from the mean
+WEEKDAY_COUNT_COLS = [f"weekday_count_{d}" for d in range(7)]
+HOUR_COUNT_COLS = [f"hour_count_{h}" for h in range(24)]
+
+# loan columns read by build_user_state
+USER_STATE_COLUMNS = [
+    USER_ID_COL,
+    ISSUE_SESSION_COL,
+    SESSION_INDEX_COL,
+    SESSION_LATE_FLAG_COL,
+    SESSION_EXTENSION_FLAG_COL,
+    WEEKDAY_COL,
+    HOUR_COL,
+    PRECISE_HOUR_COL,
+]
+# user-level values that live in the user table instead of on every loan
+USER_LEVEL_COLUMNS = [USER_MODAL_WEEKDAY_COL, USER_MODAL_HOUR_COL, USER_AVG_HOUR_COL, USER_STD_HOUR_COL]
+
+
+def _add_row_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Row-local features (no per-user aggregation) for rows with a user id,
+    with the calendar-day session of each loan.
+    """
+    has_user = df[USER_ID_COL].notna()
+    for name in ("late_flag", "timing", "precise_hour"):
+        FEATURE_NODES[name].compute(df, has_user)
+    df.loc[has_user, ISSUE_SESSION_COL] = df.loc[has_user, ISSUE_COL].dt.floor("D")
     return df
+
+
+def _hour_moments(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-user count, mean and M2 of PRECISE_HOUR_COL.
+    """
+    g = df.groupby(USER_ID_COL)[PRECISE_HOUR_COL]
+    n = g.count()
+    mean = g.mean()
+    m2 = (df[PRECISE_HOUR_COL] - df[USER_ID_COL].map(mean)).pow(2).groupby(df[USER_ID_COL]).sum()
+    return pd.DataFrame({STATE_N_HOUR: n, STATE_MEAN_HOUR: mean, STATE_M2_HOUR: m2})
+
+
+def _histograms(df: pd.DataFrame, users: pd.Index) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Weekday (users x 7) and hour (users x 24) histograms of df's loans.
+    """
+    codes = users.get_indexer(df[USER_ID_COL])
+    weekday = _count_matrix(codes, df[WEEKDAY_COL].to_numpy(dtype="int64"), len(users), 7)
+    hour = _count_matrix(codes, df[HOUR_COL].to_numpy(dtype="int64"), len(users), 24)
+    return weekday, hour
+
+
+def build_user_state(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-user running state of a feature frame (one row per user), from which the
+    user-level features can be updated when new loans arrive:
+    session count, last session (date, size, late/extension flags),
+    weekday/hour histograms and count/mean/M2 of the precise hour.
+    """
+    df_u = df.loc[df[USER_ID_COL].notna()]
+    g = df_u.groupby(USER_ID_COL)
+
+    state = pd.DataFrame(
+        {
+            STATE_N_SESSIONS: g[SESSION_INDEX_COL].max().astype("int64"),
+            STATE_LAST_SESSION: g[ISSUE_SESSION_COL].max(),
+        }
+    )
+
+    last = df_u[df_u[ISSUE_SESSION_COL].eq(df_u[USER_ID_COL].map(state[STATE_LAST_SESSION]))]
+    last_g = last.groupby(USER_ID_COL)
+    state[STATE_LAST_SESSION_SIZE] = last_g.size()
+    state[STATE_LAST_SESSION_LATE] = last_g[SESSION_LATE_FLAG_COL].first().astype(bool)
+    state[STATE_LAST_SESSION_EXT] = last_g[SESSION_EXTENSION_FLAG_COL].first().astype(bool)
+
+    weekday, hour = _histograms(df_u, state.index)
+    state[WEEKDAY_COUNT_COLS] = weekday
+    state[HOUR_COUNT_COLS] = hour
+
+    return state.join(_hour_moments(df_u))
+
+
+def _user_level_features(state: pd.DataFrame) -> pd.DataFrame:
+    """
+    Modal weekday/hour (lowest value on ties, like Series.mode) and mean/std hour from state.
+    """
+    n = state[STATE_N_HOUR].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.where(n > 1, np.sqrt(state[STATE_M2_HOUR].to_numpy() / (n - 1)), np.nan)
+
+    return pd.DataFrame(
+        {
+            USER_MODAL_WEEKDAY_COL: state[WEEKDAY_COUNT_COLS].to_numpy().argmax(axis=1),
+            USER_MODAL_HOUR_COL: state[HOUR_COUNT_COLS].to_numpy().argmax(axis=1),
+            USER_AVG_HOUR_COL: state[STATE_MEAN_HOUR].to_numpy(),
+            USER_STD_HOUR_COL: std,
+        },
+        index=state.index,
+    )
+
+
+def build_user_table(user_state: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per user from the per-user state (build_user_state / add_features_incremental):
+    session and loan counts, modal weekday/hour, mean/std precise hour and whether the
+    user has at least MIN_FREQUENT_USER_SESSIONS sessions. Cast to USER_SCHEMA.
+    """
+    users = _user_level_features(user_state)
+    users.insert(0, USER_N_SESSIONS_COL, user_state[STATE_N_SESSIONS].to_numpy())
+    users.insert(1, USER_N_LOANS_COL, user_state[WEEKDAY_COUNT_COLS].to_numpy().sum(axis=1))
+    users[USER_FREQUENT_COL] = users[USER_N_SESSIONS_COL] >= MIN_FREQUENT_USER_SESSIONS
+
+    users = users.rename_axis(USER_ID_COL).reset_index().sort_values(USER_ID_COL, ignore_index=True)
+    return apply_schema(users, USER_SCHEMA)
+
+
+def add_features_incremental(
+    df_prev: pd.DataFrame,
+    df_new: pd.DataFrame,
+    user_state: pd.DataFrame,
+    *,
+    session_gap_minutes: int | None = SESSION_GAP_MINUTES,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Append cleaned new loans (df_new) to a feature frame (df_prev) without
+    recomputing features for users that have no new loans.
+
+    Session indices continue from the stored session count; a new loan on the day of
+    a user's last stored session joins that session. User-level features are updated
+    from the merged state and re-broadcast to all loans of the affected users.
+    Users whose new loans are older than their last stored session are recomputed from
+    their full history with add_features. Under a gap-based session policy
+    (session_gap_minutes, see add_features) this applies to every user with new loans.
+
+    Returns (df_feat, new_user_state).
+    """
+    new = _add_row_features(df_new.copy())
+    new_u = new.loc[new[USER_ID_COL].notna()]
+
+    # users with out-of-order loans: recompute their full history
+    first_new = new_u.groupby(USER_ID_COL)[ISSUE_SESSION_COL].min()
+    if session_gap_minutes is None:
+        last_old = user_state[STATE_LAST_SESSION].reindex(first_new.index)
+        out_of_order = first_new.index[(first_new < last_old).to_numpy()]
+        reason = "out-of-order loans"
+    else:
+        # gap-based sessions can continue across the stored / new boundary at any time of day
+        out_of_order = first_new.index
+        reason = f"new loans ({session_gap_minutes} min session gap)"
+
+    if len(out_of_order):
+        print(f"[features] {len(out_of_order)} users with {reason}, recomputing their history")
+        base_cols = list(df_new.columns)
+        redo = _concat_rows(
+            [
+                df_prev.loc[df_prev[USER_ID_COL].isin(out_of_order), base_cols],
+                df_new.loc[df_new[USER_ID_COL].isin(out_of_order)],
+            ],
+            ignore_index=True,
+        )
+        redo_feat = add_features(redo, session_gap_minutes=session_gap_minutes)
+        df_prev = df_prev.loc[~df_prev[USER_ID_COL].isin(out_of_order)]
+        new = new.loc[~new[USER_ID_COL].isin(out_of_order)].copy()
+        new_u = new.loc[new[USER_ID_COL].notna()]
+        user_state = _concat_rows(
+            [user_state.drop(out_of_order, errors="ignore"), build_user_state(redo_feat)]
+        )
+    else:
+        redo_feat = None
+
+    users = pd.Index(new_u[USER_ID_COL].unique())
+    old = user_state.reindex(users)
+    is_known = old[STATE_N_SESSIONS].notna().to_numpy()
+
+    # --- sessions of the new loans ---
+    has_user = new[USER_ID_COL].notna()
+    new_rank = new_u.groupby(USER_ID_COL)[ISSUE_SESSION_COL].rank(method="dense").astype("int64")
+    continues_last = new_u[ISSUE_SESSION_COL].eq(new_u[USER_ID_COL].map(old[STATE_LAST_SESSION]))
+    joins_first = new_u[USER_ID_COL].map(continues_last.groupby(new_u[USER_ID_COL]).any())
+
+    n_prev = new_u[USER_ID_COL].map(old[STATE_N_SESSIONS]).fillna(0).astype("int64")
+    new.loc[has_user, SESSION_INDEX_COL] = n_prev + new_rank - joins_first.astype("int64")
+
+    keys = [USER_ID_COL, ISSUE_SESSION_COL]
+    _, size, _, (late, ext) = _sessions(
+        pd.factorize(new_u[USER_ID_COL])[0],
+        _day_numbers(new_u[ISSUE_SESSION_COL]),
+        new_u[LATE_FLAG_COL].to_numpy(dtype=bool),
+        new_u[EXTENSIONS_COL].gt(0).to_numpy(dtype=bool),
+    )
+
+    # sessions continuing the stored last session also count the stored loans
+    prev_size = new_u[USER_ID_COL].map(old[STATE_LAST_SESSION_SIZE]).where(continues_last, 0)
+    prev_late = new_u[USER_ID_COL].map(old[STATE_LAST_SESSION_LATE]).where(continues_last, False)
+    prev_ext = new_u[USER_ID_COL].map(old[STATE_LAST_SESSION_EXT]).where(continues_last, False)
+    new.loc[has_user, SESSION_SIZE_COL] = size + prev_size.to_numpy(dtype="int64")
+    new.loc[has_user, SESSION_LATE_FLAG_COL] = late | prev_late.to_numpy(dtype=bool)
+    new.loc[has_user, SESSION_EXTENSION_FLAG_COL] = ext | prev_ext.to_numpy(dtype=bool)
+    new.loc[has_user, EXPERIENCE_STAGE_COL] = (
+        new.loc[has_user, SESSION_INDEX_COL]
+        .le(EXPERIENCE_CUTOFF)
+        .map({True: "early", False: "experienced"})
+    )
+    new_u = new.loc[has_user]
+
+    # --- merge state ---
+    weekday, hour = _histograms(new_u, users)
+    moments_new = _hour_moments(new_u).reindex(users)
+    merged = pd.DataFrame(index=users)
+    merged[WEEKDAY_COUNT_COLS] = old[WEEKDAY_COUNT_COLS].fillna(0).to_numpy(dtype="int64") + weekday
+    merged[HOUR_COUNT_COLS] = old[HOUR_COUNT_COLS].fillna(0).to_numpy(dtype="int64") + hour
+
+    n_a = old[STATE_N_HOUR].fillna(0).to_numpy(dtype=float)
+    mean_a = old[STATE_MEAN_HOUR].fillna(0).to_numpy(dtype=float)
+    m2_a = old[STATE_M2_HOUR].fillna(0).to_numpy(dtype=float)
+    n_b = moments_new[STATE_N_HOUR].to_numpy(dtype=float)
+    mean_b = moments_new[STATE_MEAN_HOUR].to_numpy(dtype=float)
+    m2_b = moments_new[STATE_M2_HOUR].to_numpy(dtype=float)
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    merged[STATE_N_HOUR] = n.astype("int64")
+    merged[STATE_MEAN_HOUR] = mean_a + delta * n_b / n
+    merged[STATE_M2_HOUR] = m2_a + m2_b + delta**2 * n_a * n_b / n
+
+    last_new = new_u.groupby(USER_ID_COL)[ISSUE_SESSION_COL].max().reindex(users)
+    last_rows = new.loc[has_user & new[ISSUE_SESSION_COL].eq(new[USER_ID_COL].map(last_new))]
+    last_g = last_rows.groupby(USER_ID_COL)
+    merged[STATE_N_SESSIONS] = new_u.groupby(USER_ID_COL)[SESSION_INDEX_COL].max().reindex(users).astype("int64")
+    merged[STATE_LAST_SESSION] = last_new
+    merged[STATE_LAST_SESSION_SIZE] = last_g[SESSION_SIZE_COL].first().astype("int64")
+    merged[STATE_LAST_SESSION_LATE] = last_g[SESSION_LATE_FLAG_COL].first().astype(bool)
+    merged[STATE_LAST_SESSION_EXT] = last_g[SESSION_EXTENSION_FLAG_COL].first().astype(bool)
+
+    # --- typical-time match for all loans of affected users (from the merged state) ---
+    user_feat = _user_level_features(merged)
+    df_prev = df_prev.drop(columns=USER_LEVEL_COLUMNS, errors="ignore")  # older versions stored them per loan
+    prev_hit = df_prev[USER_ID_COL].isin(users)
+    new[USER_MATCH_TYPICAL_COL] = False
+    for frame, mask in [(df_prev, prev_hit), (new, has_user)]:
+        codes = user_feat.index.get_indexer(frame.loc[mask, USER_ID_COL])
+        frame.loc[mask, USER_MATCH_TYPICAL_COL] = (
+            (frame.loc[mask, WEEKDAY_COL].to_numpy(dtype="int64")
+             == user_feat[USER_MODAL_WEEKDAY_COL].to_numpy().take(codes)) &
+            (frame.loc[mask, HOUR_COL].to_numpy(dtype="int64")
+             == user_feat[USER_MODAL_HOUR_COL].to_numpy().take(codes))
+        )
+
+    # stored loans of a continued last session get the combined size/flags
+    cont = new_u.loc[continues_last, keys].drop_duplicates()
+    if not cont.empty:
+        cont_stats = new.loc[has_user].groupby(keys)[
+            [SESSION_SIZE_COL, SESSION_LATE_FLAG_COL, SESSION_EXTENSION_FLAG_COL]
+        ].first().reindex(pd.MultiIndex.from_frame(cont))
+        idx = pd.MultiIndex.from_frame(df_prev[keys])
+        hit = idx.isin(cont_stats.index)
+        for col in cont_stats.columns:
+            df_prev.loc[hit, col] = cont_stats[col].reindex(idx[hit]).to_numpy()
+
+    parts = [df_prev, new[df_prev.columns]]
+    if redo_feat is not None:
+        parts.append(redo_feat[df_prev.columns])
+    # same dtypes in every part: all-NA columns (e.g. loans without user) do not decide the result dtype
+    df = _concat_rows([apply_schema(part, FEATURE_SCHEMA) for part in parts], ignore_index=True)
+
+    state = _concat_rows([user_state.drop(users, errors="ignore"), merged[user_state.columns]])
+    print(
+        f"[features] incremental update: {len(df_new)} new loans, "
+        f"{len(users) + len(out_of_order)} users updated ({len(out_of_order)} recomputed)"
+    )
+    return apply_schema(df, FEATURE_SCHEMA, report="features"), state
@@ -1,22 +1,114 @@
 # src/io.py
 from __future__ import annotations
 
+import hashlib
 import json
+import os
 import re
+import shutil
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import repeat
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-
-from src.config import SOURCE_YEAR_COL
-from src.config import CLOSED_DATE_COL
-
-
-def load_borrowings_raw(borrowings_dir: Path) -> pd.DataFrame:
-    """
-    Load all borrowings_*.csv files from a directory and concatenate them.
-    Adds SOURCE_YEAR_COL extracted from filename (e.g. borrowings_2021.csv).
-    """
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src import config
+from src.config import (
+    SOURCE_YEAR_COL,
+    CLOSED_DATE_COL,
+    ISSUE_ID_COL,
+    ISSUE_COL,
+    RETURN_COL,
+    LOAN_DURATION_COL,
+    EXTENSIONS_COL,
+    LATE_COL,
+    DAYS_LATE_COL,
+    COLLECTION_CODE_COL,
+    MEDIA_TYPE_COL,
+    BARCODE_COL,
+    TITLE_COL,
+    AUTHOR_COL,
+    ISBN_COL,
+    TOPIC_COL,
+    USER_ID_COL,
+    USER_CATEGORY_COL,
+    USER_CATEGORY_DESC_COL,
+    USER_CATEGORY_GROUP_COL,
+    COLLECTION_CODE_DESC_COL,
+)
+from src.schema import RAW_SCHEMA, FEATURE_SCHEMA, SESSION_SCHEMA, USER_SCHEMA, apply_schema
+
+
+CSV_ENGINES = ("c", "pyarrow", "python")
+
+# processed output: <version>/borrowings/source_year=YYYY/*.parquet
+PROCESSED_DATASET_NAME = "borrowings"
+PROCESSED_ROW_GROUP_ROWS = 128_000
+# optional uncompressed Arrow IPC copy of the same table, memory-mapped on load
+PROCESSED_IPC_NAME = "borrowings.arrow"
+# per-user running state for incremental updates (see features.build_user_state)
+USER_STATE_NAME = "user_state.parquet"
+# one row per user-session (see features.build_session_table)
+SESSIONS_NAME = "sessions.parquet"
+# one row per user (see features.build_user_table)
+USERS_NAME = "users.parquet"
+# optional audit of the rows removed by preprocessing (see preprocess.preprocess_borrowings)
+REMOVED_ROWS_NAME = "removed_rows.parquet"
+
+# alias for the most recently created processed version
+LATEST_VERSION = "latest"
+
+# sources whose content determines the processed data (code part of the fingerprint)
+PIPELINE_SOURCE_FILES = (
+    "config.py",
+    "io.py",
+    "preprocess.py",
+    "open_days.py",
+    "features.py",
+    "schema.py",
+)
+
+# config constants (besides all *_COL names) that change the processed data
+FINGERPRINT_CONFIG_KEYS = (
+    "LIB_WEEKMASK",
+    "RAW_TIMESTAMP_FORMATS",
+    "REMOVE_USER_CATEGORIES",
+    "BASE_ALLOWED_OPEN_DAYS",
+    "MAX_EXTENSIONS_CAP",
+    "EXPERIENCE_CUTOFF",
+    "SESSION_GAP_MINUTES",
+)
+
+# explicit parse dtypes for the raw export (skips per-column type inference)
+# timestamps and the late flag stay strings, preprocess parses/normalizes them
+RAW_CSV_DTYPES = {
+    ISSUE_ID_COL: "int64",
+    ISSUE_COL: "object",
+    RETURN_COL: "object",
+    LOAN_DURATION_COL: "float64",
+    EXTENSIONS_COL: "float64",
+    LATE_COL: "object",
+    DAYS_LATE_COL: "float64",
+    COLLECTION_CODE_COL: "object",
+    MEDIA_TYPE_COL: "object",
+    BARCODE_COL: "object",
+    TITLE_COL: "object",
+    AUTHOR_COL: "object",
+    ISBN_COL: "object",
+    TOPIC_COL: "object",
+    USER_ID_COL: "float64",
+    USER_CATEGORY_COL: "object",
+}
+
+
+def _find_borrowings_files(borrowings_dir: Path) -> list[Path]:
     if not borrowings_dir.exists() or not borrowings_dir.is_dir():
         raise FileNotFoundError(f"Borrowings directory not found: {borrowings_dir}")
 
@@ -25,20 +117,350 @@ def load_borrowings_raw(borrowings_dir: Path) -> pd.DataFrame:
         raise FileNotFoundError(
             f"No files matching 'borrowings_*.csv' in: {borrowings_dir}"
         )
+    return files
 
-    dfs: list[pd.DataFrame] = []
-    for f in files:
-        df = pd.read_csv(f, sep=";", engine="python")
 
-        match = re.search(r"(19|20)\d{2}", f.name)
-        if match:
-            df[SOURCE_YEAR_COL] = int(match.group())
+def _source_year_from_name(path: Path) -> int | None:
+    match = re.search(r"(19|20)\d{2}", path.name)
+    return int(match.group()) if match else None
+
+
+def _raw_csv_dtypes(path: Path) -> dict[str, str]:
+    """
+    RAW_CSV_DTYPES restricted to the columns present in the file header.
+    """
+    header = pd.read_csv(path, sep=";", nrows=0).columns
+    return {col: dtype for col, dtype in RAW_CSV_DTYPES.items() if col in header}
+
+
+def _read_csv_pyarrow(path: Path, dtypes: dict[str, str]) -> pd.DataFrame:
+    """
+    pd.read_csv(path, sep=";", dtype=dtypes) via pyarrow.csv. The dtypes are passed as
+    column_types: pd.read_csv(engine="pyarrow") infers types first and casts afterwards,
+    which turns timestamp strings into Timestamps and drops leading zeros of codes.
+    """
+    column_types = {
+        col: pa.string() if dtype == "object" else pa.from_numpy_dtype(dtype)
+        for col, dtype in dtypes.items()
+    }
+    table = pacsv.read_csv(
+        path,
+        parse_options=pacsv.ParseOptions(delimiter=";"),
+        convert_options=pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True),
+    )
+    df = table.to_pandas()
+    for col, dtype in dtypes.items():
+        if dtype == "object":
+            # missing strings as NaN, like the c engine (to_pandas gives None)
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
 
-        dfs.append(df)
+def _read_borrowings_file(path: Path, engine: str = "c") -> pd.DataFrame:
+    """
+    Parse a single borrowings_YYYY.csv and attach SOURCE_YEAR_COL.
+    Module-level so it can be pickled into worker processes.
+    """
+    if engine == "pyarrow":
+        df = _read_csv_pyarrow(path, _raw_csv_dtypes(path))
+    else:
+        df = pd.read_csv(path, sep=";", engine=engine, dtype=_raw_csv_dtypes(path))
+
+    year = _source_year_from_name(path)
+    if year is not None:
+        # scalar assignment broadcasts into a new column block, no frame copy
+        df[SOURCE_YEAR_COL] = year
+
+    return df
 
-    return pd.concat(dfs, ignore_index=True)
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    """
+    Content hash of a file, read in chunks.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
 
+def _raw_schema_fingerprint(engine: str) -> str:
+    """
+    Fingerprint of the raw parse schema and CSV engine; cached pieces are invalid if
+    either changes.
+    """
+    payload = json.dumps({"dtypes": RAW_CSV_DTYPES, "engine": engine}, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def _load_ingest_manifest(cache_dir: Path) -> dict:
+    manifest_path = cache_dir / "manifest.json"
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _save_ingest_manifest(cache_dir: Path, manifest: dict) -> None:
+    tmp_path = cache_dir / "manifest.json.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    tmp_path.replace(cache_dir / "manifest.json")
+
+
+def _lookup_ingest_cache(path: Path, cache_dir: Path, manifest: dict, engine: str) -> Path | None:
+    """
+    Return the cached parquet piece for a raw file if it is still valid, else None.
+
+    Size + mtime match is trusted directly; on a stat mismatch the content hash
+    decides (e.g. a file that was touched or copied but not changed).
+    """
+    entry = manifest.get(path.name)
+    if entry is None or entry.get("schema") != _raw_schema_fingerprint(engine):
+        return None
+
+    piece = cache_dir / entry["parquet"]
+    if not piece.exists():
+        return None
+
+    stat = path.stat()
+    if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+        return piece
+
+    if stat.st_size == entry["size"] and file_sha256(path) == entry["sha256"]:
+        entry["mtime_ns"] = stat.st_mtime_ns
+        return piece
+
+    return None
+
+
+def _store_ingest_cache(
+    path: Path, df: pd.DataFrame, cache_dir: Path, manifest: dict, engine: str
+) -> None:
+    """
+    Write one parsed raw file as parquet, named by its content hash.
+    """
+    stat = path.stat()
+    sha = file_sha256(path)
+    piece_name = f"{path.stem}_{sha[:16]}.parquet"
+
+    old = manifest.get(path.name)
+    if old is not None and old["parquet"] != piece_name:
+        (cache_dir / old["parquet"]).unlink(missing_ok=True)
+
+    df.to_parquet(cache_dir / piece_name, index=False)
+    manifest[path.name] = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha,
+        "schema": _raw_schema_fingerprint(engine),
+        "parquet": piece_name,
+    }
+
+
+def load_borrowings_raw(
+    borrowings_dir: Path,
+    *,
+    workers: int = 1,
+    engine: str = "c",
+    cache_dir: Path | None = None,
+    only: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Load all borrowings_*.csv files from a directory and concatenate them.
+    Adds SOURCE_YEAR_COL extracted from filename (e.g. borrowings_2021.csv).
+
+    workers > 1 parses the year files in parallel in a process pool
+    (workers = 0 uses one process per CPU). engine is the pd.read_csv engine
+    ("c" or "pyarrow"; "python" only as a fallback for malformed files); "pyarrow"
+    reads via pyarrow.csv so the RAW_CSV_DTYPES are applied while parsing.
+
+    If cache_dir is given, every parsed file is kept there as typed parquet
+    (keyed by size, mtime, sha256 and engine) and only new or modified files are re-parsed.
+
+    only restricts loading to the given file names (e.g. ["borrowings_2026.csv"]).
+
+    The concatenated frame is cast to the compact RAW_SCHEMA (src/schema.py).
+    """
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Unknown CSV engine '{engine}', expected one of {CSV_ENGINES}")
+
+    files = _find_borrowings_files(borrowings_dir)
+    if only is not None:
+        files = [f for f in files if f.name in set(only)]
+        if not files:
+            raise FileNotFoundError(f"None of {only} found in: {borrowings_dir}")
+
+    pieces: dict[Path, pd.DataFrame] = {}
+    manifest: dict = {}
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        manifest = _load_ingest_manifest(cache_dir)
+        for f in files:
+            piece = _lookup_ingest_cache(f, cache_dir, manifest, engine)
+            if piece is not None:
+                pieces[f] = pd.read_parquet(piece)
+
+    to_parse = [f for f in files if f not in pieces]
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(to_parse)))
+
+    if workers == 1:
+        parsed = [_read_borrowings_file(f, engine) for f in to_parse]
+    else:
+        print(f"[io] parsing {len(to_parse)} raw files with {workers} workers ({engine} engine)")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(_read_borrowings_file, to_parse, repeat(engine)))
+
+    pieces.update(zip(to_parse, parsed))
+
+    if cache_dir is not None:
+        for f, df in zip(to_parse, parsed):
+            _store_ingest_cache(f, df, cache_dir, manifest, engine)
+        _save_ingest_manifest(cache_dir, manifest)
+        print(
+            f"[io] ingest cache: {len(files) - len(to_parse)} files reused, "
+            f"{len(to_parse)} parsed"
+        )
+
+    df = pd.concat([pieces[f] for f in files], ignore_index=True)
+    return apply_schema(df, RAW_SCHEMA, report="raw")
+
+
+def iter_borrowings_raw_chunks(
+    borrowings_dir: Path,
+    *,
+    chunksize: int,
+    engine: str = "c",
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream all borrowings_*.csv files as chunks of at most chunksize rows,
+    with SOURCE_YEAR_COL attached and cast to RAW_SCHEMA (same schema as
+    load_borrowings_raw; categories are per chunk).
+    """
+    if engine == "pyarrow":
+        raise ValueError("Chunked reading is not supported by the pyarrow CSV engine, use 'c'")
+    if engine not in CSV_ENGINES:
+        raise ValueError(f"Unknown CSV engine '{engine}', expected one of {CSV_ENGINES}")
+
+    for f in _find_borrowings_files(borrowings_dir):
+        year = _source_year_from_name(f)
+        with pd.read_csv(
+            f, sep=";", engine=engine, dtype=_raw_csv_dtypes(f), chunksize=chunksize
+        ) as reader:
+            for chunk in reader:
+                if year is not None:
+                    chunk[SOURCE_YEAR_COL] = year
+                yield apply_schema(chunk, RAW_SCHEMA)
+
+
+def _stable_chunk_field(field: pa.Field) -> pa.Field:
+    # writer schema type that every later chunk can be cast to
+    if pa.types.is_null(field.type):
+        return field.with_type(pa.string())
+    if pa.types.is_dictionary(field.type):
+        return field.with_type(pa.dictionary(pa.int32(), pa.string()))
+    return field
+
+
+def write_parquet_chunks(chunks: Iterable[pd.DataFrame], path: Path) -> int:
+    """
+    Append DataFrame chunks to a single parquet file, one row group per chunk.
+
+    The schema is fixed by the first chunk; columns that are all-null there are
+    stored as strings so later chunks can be cast to the same schema. Categorical
+    columns get a per-chunk dictionary from pandas (int8 indices for a small chunk,
+    null values if all-null), so they are always stored as dictionary<int32, string>.
+    Returns the number of rows written.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+
+    writer: pq.ParquetWriter | None = None
+    n_rows = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = pa.schema(
+                    [_stable_chunk_field(field) for field in table.schema],
+                    metadata=table.schema.metadata,
+                )
+                writer = pq.ParquetWriter(tmp_path, schema)
+            writer.write_table(table.cast(writer.schema))
+            n_rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        raise ValueError(f"No chunks to write to {path}")
+
+    tmp_path.replace(path)
+    return n_rows
+
+
+
+
+def _load_lookup_cached(path: Path, cache_dir: Path | None, parse) -> pd.DataFrame:
+    """
+    Parse an xlsx lookup table once and keep it as parquet in cache_dir,
+    keyed by the file's content hash (a changed xlsx gets a new cache file).
+    """
+    if not path.exists():
+        raise FileNotFoundError(f"Lookup table not found: {path}")
+
+    if cache_dir is None:
+        return parse(path)
+
+    cached = cache_dir / f"{path.stem}_{file_sha256(path)[:16]}.parquet"
+    if cached.exists():
+        return pd.read_parquet(cached)
+
+    print(f"[io] converting lookup table: {path.name}")
+    df = parse(path)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for old in cache_dir.glob(f"{path.stem}_*.parquet"):
+        old.unlink()
+    df.to_parquet(cached, index=False)
+    return df
+
+
+def _parse_user_categories(path: Path) -> pd.DataFrame:
+    # sheet without header: code | description | group, separated by empty rows
+    df = pd.read_excel(path, header=None, usecols=[0, 1, 2], dtype=str)
+    df.columns = [USER_CATEGORY_COL, USER_CATEGORY_DESC_COL, USER_CATEGORY_GROUP_COL]
+    df = df.dropna(subset=[USER_CATEGORY_COL])
+    return df.apply(lambda s: s.str.strip()).drop_duplicates(USER_CATEGORY_COL).reset_index(drop=True)
+
+
+def _parse_collection_codes(path: Path) -> pd.DataFrame:
+    # sheet with header: "Sammlungszeichen / CCODE" | "Beschreibung"
+    df = pd.read_excel(path, usecols=[0, 1], dtype=str)
+    df.columns = [COLLECTION_CODE_COL, COLLECTION_CODE_DESC_COL]
+    df = df.dropna(subset=[COLLECTION_CODE_COL])
+    return df.apply(lambda s: s.str.strip()).drop_duplicates(COLLECTION_CODE_COL).reset_index(drop=True)
+
+
+def load_user_categories(path: Path, *, cache_dir: Path | None = None) -> pd.DataFrame:
+    """
+    User category lookup (Benutzerkategorien.xlsx):
+    USER_CATEGORY_COL -> USER_CATEGORY_DESC_COL, USER_CATEGORY_GROUP_COL.
+    Needs openpyxl only when the parquet cache is missing or stale.
+    """
+    return _load_lookup_cached(path, cache_dir, _parse_user_categories)
+
+
+def load_collection_codes(path: Path, *, cache_dir: Path | None = None) -> pd.DataFrame:
+    """
+    Collection code lookup (Sammlungszeichen_CCODE.xlsx):
+    COLLECTION_CODE_COL -> COLLECTION_CODE_DESC_COL.
+    Needs openpyxl only when the parquet cache is missing or stale.
+    """
+    return _load_lookup_cached(path, cache_dir, _parse_collection_codes)
 
 
 def load_closed_days(path: Path) -> pd.DataFrame:
@@ -54,42 +476,340 @@ def load_closed_days(path: Path) -> pd.DataFrame:
 
 
 
-def save_processed(df: pd.DataFrame, out_dir: Path, version: str) -> None:
+def _processed_partitioning() -> ds.Partitioning:
+    return ds.partitioning(pa.schema([(SOURCE_YEAR_COL, pa.int16())]), flavor="hive")
+
+
+def _sha256_json(payload) -> str:
+    data = json.dumps(payload, sort_keys=True, default=lambda o: sorted(o) if isinstance(o, (set, frozenset)) else str(o))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _config_fingerprint() -> str:
+    keys = sorted(k for k in vars(config) if k.endswith("_COL")) + list(FINGERPRINT_CONFIG_KEYS)
+    return _sha256_json({k: getattr(config, k) for k in keys})
+
+
+def _code_fingerprint() -> str:
+    src_dir = Path(__file__).resolve().parent
+    return _sha256_json({name: file_sha256(src_dir / name) for name in PIPELINE_SOURCE_FILES})
+
+
+def compute_input_fingerprint(
+    borrowings_dir: Path,
+    closed_days_file: Path,
+    *,
+    cache_dir: Path | None = None,
+    lookup_files: list[Path] | None = None,
+    reference: dict | None = None,
+) -> dict:
+    """
+    Fingerprint of everything the processed dataset depends on: raw files,
+    closed days, lookup tables, relevant config constants and pipeline code.
+
+    Raw file hashes are taken from the ingest cache manifest when size and mtime
+    still match, so unchanged files are not re-hashed. The size and mtime of each
+    raw file are recorded as well (raw_file_stats, not part of the combined hash).
+
+    reference (a stored fingerprint with raw_file_stats) makes the raw file part a
+    stat-only comparison: files whose size and mtime match it keep its hash, all
+    others get None, and no raw file is read.
+    """
+    files = _find_borrowings_files(borrowings_dir)
+    stats = {}
+    for f in files:
+        stat = f.stat()
+        stats[f.name] = [stat.st_size, stat.st_mtime_ns]
+
+    if reference is not None and "raw_file_stats" in reference:
+        known = reference["raw_file_stats"]
+        raw_files = {
+            name: reference["raw_files"].get(name) if known.get(name) == stat else None
+            for name, stat in stats.items()
+        }
+    else:
+        manifest = _load_ingest_manifest(cache_dir) if cache_dir is not None and cache_dir.exists() else {}
+        raw_files = {}
+        for f in files:
+            entry = manifest.get(f.name)
+            size, mtime_ns = stats[f.name]
+            if entry is not None and entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+                raw_files[f.name] = entry["sha256"]
+            else:
+                raw_files[f.name] = file_sha256(f)
+
+    fingerprint = {
+        "raw_files": raw_files,
+        "closed_days": file_sha256(closed_days_file),
+        "lookup_tables": {f.name: file_sha256(f) for f in lookup_files or []},
+        "config": _config_fingerprint(),
+        "code": _code_fingerprint(),
+    }
+    fingerprint["combined"] = _sha256_json(fingerprint)
+    fingerprint["raw_file_stats"] = stats
+    return fingerprint
+
+
+def diff_fingerprints(old: dict | None, new: dict) -> list[str]:
+    """
+    Names of the fingerprint parts that differ (all parts if old is missing).
+    """
+    parts = ["raw_files", "closed_days", "lookup_tables", "config", "code"]
+    if not old:
+        return parts
+    return [k for k in parts if old.get(k) != new.get(k)]
+
+
+def read_processed_metadata(processed_root: Path, version: str) -> dict:
+    meta_path = processed_root / version / "metadata.json"
+    if not meta_path.exists():
+        raise FileNotFoundError(f"Missing metadata.json in {meta_path.parent}")
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def _list_processed_versions(processed_root: Path) -> list[tuple[str, dict]]:
+    """
+    (version, metadata) for all processed versions, newest first.
+    """
+    if not processed_root.exists():
+        return []
+
+    versions = []
+    for meta_path in processed_root.glob("*/metadata.json"):
+        with open(meta_path) as f:
+            versions.append((meta_path.parent.name, json.load(f)))
+    return sorted(versions, key=lambda v: v[1].get("created_at", ""), reverse=True)
+
+
+def resolve_processed_version(processed_root: Path, version: str) -> str:
+    """
+    Resolve the 'latest' alias to the most recently created processed version.
+    """
+    if version != LATEST_VERSION:
+        return version
+
+    versions = _list_processed_versions(processed_root)
+    if not versions:
+        raise FileNotFoundError(f"No processed versions found in {processed_root}")
+    return versions[0][0]
+
+
+def find_processed_version(
+    processed_root: Path,
+    fingerprint: dict,
+    *,
+    prefer: str | None = None,
+) -> str | None:
+    """
+    Return a processed version whose inputs match fingerprint (prefer wins on ties), or None.
+    """
+    matches = [
+        version
+        for version, meta in _list_processed_versions(processed_root)
+        if meta.get("fingerprint", {}).get("combined") == fingerprint["combined"]
+    ]
+    if prefer in matches:
+        return prefer
+    return matches[0] if matches else None
+
+
+def save_processed(
+    df: pd.DataFrame,
+    out_dir: Path,
+    version: str,
+    *,
+    ipc: bool = False,
+    fingerprint: dict | None = None,
+    user_state: pd.DataFrame | None = None,
+    sessions: pd.DataFrame | None = None,
+    users: pd.DataFrame | None = None,
+) -> None:
+    """
+    Save the processed dataset as a hive-partitioned parquet dataset
+    (out_dir/borrowings/source_year=YYYY/...), sorted by user and issue time
+    within each year, plus metadata.json.
+
+    ipc=True additionally writes an uncompressed Arrow IPC file that
+    load_processed_version memory-maps instead of decoding parquet.
+    fingerprint (see compute_input_fingerprint) is stored in metadata.json,
+    user_state (see features.build_user_state), sessions
+    (see features.build_session_table) and users (see features.build_user_table)
+    next to the data.
+    """
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    df.to_parquet(out_dir / "borrowings.parquet", index=False)
+    dataset_dir = out_dir / PROCESSED_DATASET_NAME
+    if dataset_dir.exists():
+        shutil.rmtree(dataset_dir)
+    # older versions were written as one monolithic file
+    (out_dir / "borrowings.parquet").unlink(missing_ok=True)
+
+    # year first so the partitioned dataset and the IPC copy share one row order
+    table = pa.Table.from_pandas(df, preserve_index=False).sort_by(
+        [(SOURCE_YEAR_COL, "ascending"), (USER_ID_COL, "ascending"), (ISSUE_COL, "ascending")]
+    )
+    ds.write_dataset(
+        table,
+        dataset_dir,
+        format="parquet",
+        partitioning=_processed_partitioning(),
+        max_rows_per_group=PROCESSED_ROW_GROUP_ROWS,
+        min_rows_per_group=PROCESSED_ROW_GROUP_ROWS // 2,
+    )
+
+    ipc_path = out_dir / PROCESSED_IPC_NAME
+    ipc_path.unlink(missing_ok=True)
+    if ipc:
+        tmp_path = ipc_path.with_suffix(".arrow.tmp")
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=PROCESSED_ROW_GROUP_ROWS)
+        tmp_path.replace(ipc_path)
+
+    state_path = out_dir / USER_STATE_NAME
+    state_path.unlink(missing_ok=True)
+    if user_state is not None:
+        user_state.to_parquet(state_path)
+
+    sessions_path = out_dir / SESSIONS_NAME
+    sessions_path.unlink(missing_ok=True)
+    if sessions is not None:
+        sessions.to_parquet(sessions_path, index=False, row_group_size=PROCESSED_ROW_GROUP_ROWS)
+
+    users_path = out_dir / USERS_NAME
+    users_path.unlink(missing_ok=True)
+    if users is not None:
+        users.to_parquet(users_path, index=False)
 
     metadata = {
         "version": version,
         "rows": int(len(df)),
         "created_at": datetime.utcnow().isoformat(),
         "columns": list(df.columns),
+        "layout": {
+            "partitioned_by": SOURCE_YEAR_COL,
+            "sorted_by": [SOURCE_YEAR_COL, USER_ID_COL, ISSUE_COL],
+            "row_group_rows": PROCESSED_ROW_GROUP_ROWS,
+            "ipc": ipc,
+        },
+        "fingerprint": fingerprint,
     }
 
     with open(out_dir / "metadata.json", "w") as f:
         json.dump(metadata, f, indent=2)
 
 
-def load_processed_version(processed_root: Path, version: str) -> pd.DataFrame:
+def load_processed_version(
+    processed_root: Path,
+    version: str,
+    *,
+    columns: list[str] | None = None,
+    years: list[int] | None = None,
+    filters: ds.Expression | None = None,
+    use_ipc: bool = True,
+) -> pd.DataFrame:
     """
-    Load a specific processed dataset version, e.g. version='v1'.
+    Load a specific processed dataset version, e.g. version='v1' (or 'latest').
+
+    columns / years / filters (a pyarrow.dataset expression) are pushed down to the
+    parquet reader, so only the requested columns and matching partitions /
+    row groups are decoded.
+
+    If the version has an Arrow IPC copy (save_processed(..., ipc=True)) and use_ipc
+    is set, that file is memory-mapped instead: no decode, column buffers are shared
+    with the page cache (and with other processes reading the same version).
     """
+    version = resolve_processed_version(processed_root, version)
     out_dir = processed_root / version
 
     if not out_dir.exists() or not out_dir.is_dir():
         raise FileNotFoundError(f"Processed version not found: {out_dir}")
 
+    dataset_dir = out_dir / PROCESSED_DATASET_NAME
     parquet_path = out_dir / "borrowings.parquet"
     meta_path = out_dir / "metadata.json"
 
-    if not parquet_path.exists():
-        raise FileNotFoundError(f"Missing borrowings.parquet in {out_dir}")
+    if dataset_dir.is_dir():
+        dataset = ds.dataset(dataset_dir, format="parquet", partitioning=_processed_partitioning())
+    elif parquet_path.exists():
+        dataset = ds.dataset(parquet_path, format="parquet")
+    else:
+        raise FileNotFoundError(f"Missing {PROCESSED_DATASET_NAME}/ dataset in {out_dir}")
 
     if not meta_path.exists():
         raise FileNotFoundError(f"Missing metadata.json in {out_dir}")
 
+    if years is not None:
+        year_filter = ds.field(SOURCE_YEAR_COL).isin([int(y) for y in years])
+        filters = year_filter if filters is None else (filters & year_filter)
+
+    with open(meta_path) as f:
+        saved_columns = json.load(f)["columns"]
+
+    ipc_path = out_dir / PROCESSED_IPC_NAME
+    if use_ipc and ipc_path.exists():
+        print(f"[io] memory-mapping processed dataset version: {version}")
+        with pa.memory_map(str(ipc_path), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        # filter before projecting: the filter may reference columns that are not selected
+        if filters is not None:
+            table = table.filter(filters)
+        if columns is not None:
+            table = table.select(columns)
+        # split_blocks avoids consolidating columns into new 2D blocks (zero-copy where possible)
+        return apply_schema(table.to_pandas(split_blocks=True), FEATURE_SCHEMA)
+
     print(f"[io] loading processed dataset version: {version}")
-    return pd.read_parquet(parquet_path)
+    table = dataset.to_table(columns=columns, filter=filters)
+    if columns is None:
+        # partition column comes back last, restore the saved column order
+        table = table.select([c for c in saved_columns if c in table.column_names])
+
+    return apply_schema(table.to_pandas(), FEATURE_SCHEMA)
+
+
+def load_user_state(processed_root: Path, version: str) -> pd.DataFrame | None:
+    """
+    Load the per-user state saved with a processed version (None if it has none).
+    """
+    path = processed_root / resolve_processed_version(processed_root, version) / USER_STATE_NAME
+    if not path.exists():
+        return None
+    return pd.read_parquet(path)
+
+
+def load_sessions(
+    processed_root: Path,
+    version: str,
+    *,
+    years: list[int] | None = None,
+) -> pd.DataFrame | None:
+    """
+    Load the session table saved with a processed version (None if it has none).
+    years restricts it to sessions from these source years, like load_processed_version.
+    """
+    path = processed_root / resolve_processed_version(processed_root, version) / SESSIONS_NAME
+    if not path.exists():
+        return None
+
+    filters = None
+    if years is not None:
+        filters = [(SOURCE_YEAR_COL, "in", [int(y) for y in years])]
+    print(f"[io] loading session table: {path.parent.name}")
+    return apply_schema(pd.read_parquet(path, filters=filters), SESSION_SCHEMA)
+
+
+def load_users(processed_root: Path, version: str) -> pd.DataFrame | None:
+    """
+    Load the user table saved with a processed version (None if it has none).
+    The table always covers all source years of the version.
+    """
+    path = processed_root / resolve_processed_version(processed_root, version) / USERS_NAME
+    if not path.exists():
+        return None
+    print(f"[io] loading user table: {path.parent.name}")
+    return apply_schema(pd.read_parquet(path), USER_SCHEMA)
 
 
 def load_borrowings_cleaned(path: Path) -> pd.DataFrame:
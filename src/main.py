@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import argparse
+import tempfile
 from pathlib import Path
 
 import pandas as pd
@@ -9,25 +10,85 @@ import pandas as pd
 from src.config import (
     RAW_BORROWINGS_DIR,
     CLOSED_DAYS_FILE,
+    USER_CATEGORIES_FILE,
+    COLLECTION_CODES_FILE,
+    LOOKUP_CACHE_DIR,
     PROCESSED_DIR,
+    INGEST_CACHE_DIR,
+    FEATURE_CACHE_DIR,
+    SWEEP_DIR,
+    SWEEP_BASE_ALLOWED_OPEN_DAYS,
+    SWEEP_MAX_EXTENSIONS_CAP,
+    SWEEP_REMOVE_USER_CATEGORIES,
     PipelineConfig,
 )
 from src.io import (
+    CSV_ENGINES,
+    REMOVED_ROWS_NAME,
+    compute_input_fingerprint,
+    diff_fingerprints,
+    find_processed_version,
+    read_processed_metadata,
+    resolve_processed_version,
+    load_user_state,
+    load_sessions,
+    load_users,
     load_borrowings_raw,
+    iter_borrowings_raw_chunks,
+    write_parquet_chunks,
     load_closed_days,
+    load_user_categories,
+    load_collection_codes,
     save_processed,
     load_processed_version
 )
-from src.preprocess import preprocess_borrowings
-from src.features import add_features
+from src.preprocess import (
+    preprocess_borrowings,
+    preprocess_borrowings_chunks,
+    sweep_cleaning_thresholds,
+)
+from src.features import (
+    add_features,
+    add_features_incremental,
+    add_lookup_columns,
+    build_session_table,
+    build_user_state,
+    build_user_table,
+)
 from src.validate import validate_borrowings
 
-from src.plotting.plot_1_libary_visit_clock import make_plot as plot1
-from src.plotting.plot_1_libary_visit_clock import print_user_statistics as user_stats
-from src.plotting.plot_2_learning_curve import make_plot as plot2
-from src.plotting.plot_3_overview import make_plot as plot3
-from src.plotting.plot_4_stickiness_to_media_type import make_plot as plot4
-from src.plotting.plot_4_stickiness_to_media_type import print_media_type_session_statistics as print_media_type_stats
+from src.plotting import plot_1_libary_visit_clock as p1
+from src.plotting import plot_2_learning_curve as p2
+from src.plotting import plot_3_overview as p3
+from src.plotting import plot_4_stickiness_to_media_type as p4
+
+
+# (function, columns it reads, tables it takes as keyword arguments)
+STATS = [
+    (p1.print_user_statistics, p1.USER_STATISTICS_COLUMNS, ("users",)),
+    (p4.print_media_type_session_statistics, p4.MEDIA_TYPE_STATISTICS_COLUMNS, ("sessions",)),
+]
+
+# (function, columns it reads, tables it takes as keyword arguments, output file name)
+PLOTS = [
+    (p1.make_plot, p1.MAKE_PLOT_COLUMNS, (), "plot_1_clock_plot.pdf"),
+    (p2.make_plot, p2.MAKE_PLOT_COLUMNS, ("sessions",), "plot_2_learning_curve.pdf"),
+    (p3.make_plot, p3.MAKE_PLOT_COLUMNS, (), "plot_3_overview.pdf"),
+    (p4.make_plot, p4.MAKE_PLOT_COLUMNS, ("sessions",), "plot_4_media_type_stickiness.pdf"),
+]
+
+
+LOOKUP_FILES = [USER_CATEGORIES_FILE, COLLECTION_CODES_FILE]
+
+
+def required_columns() -> list[str]:
+    """
+    Union of the columns read by all stats and plot functions (in first-use order).
+    """
+    columns: list[str] = []
+    for _, cols, *_ in STATS + PLOTS:
+        columns.extend(c for c in cols if c not in columns)
+    return columns
 
 
 
@@ -36,12 +97,79 @@ def parse_args() -> argparse.Namespace:
     p.add_argument(
         "--version",
         default="v1",
-        help="processed dataset version folder (e.g. v1, v2)"
+        help="processed dataset version folder (e.g. v1, v2) or 'latest' for the newest one"
     )
     p.add_argument(
         "--use-processed",
         action="store_true",
-        help="load newest processed dataset and skip preprocessing & feature generation"
+        help="load the --version processed dataset as-is and skip preprocessing & feature generation"
+    )
+    p.add_argument(
+        "--force",
+        action="store_true",
+        help="recompute even if a processed version with identical inputs exists"
+    )
+    p.add_argument(
+        "--append-to",
+        default=None,
+        metavar="VERSION",
+        help="build --version from this processed version plus only the raw files added since"
+    )
+    p.add_argument(
+        "--ipc-cache",
+        action="store_true",
+        help="also save an uncompressed Arrow IPC file that --use-processed memory-maps"
+    )
+    p.add_argument(
+        "--years",
+        type=int,
+        nargs="+",
+        default=None,
+        help="when loading a processed version: only load these source years (partition pruning)"
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes used to parse the raw CSV files in parallel (0 = one per CPU)"
+    )
+    p.add_argument(
+        "--csv-engine",
+        choices=CSV_ENGINES,
+        default="c",
+        help="pandas CSV parser used for the raw files"
+    )
+    p.add_argument(
+        "--no-ingest-cache",
+        action="store_true",
+        help="always re-parse all raw CSV files instead of reusing the parquet ingest cache"
+    )
+    p.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="stream raw CSVs in chunks of this many rows through preprocessing (bounded memory)"
+    )
+    p.add_argument(
+        "--feature-workers",
+        type=int,
+        default=1,
+        help="processes computing the features in parallel, loans sharded by user (0 = one per CPU)"
+    )
+    p.add_argument(
+        "--feature-cache",
+        action="store_true",
+        help="reuse feature columns cached for identical cleaned data (dat/processed/feature_cache/)"
+    )
+    p.add_argument(
+        "--sweep",
+        action="store_true",
+        help="only evaluate the SWEEP_* cleaning threshold grids from config.py and write cleaning_sweep.csv"
+    )
+    p.add_argument(
+        "--audit-removed",
+        action="store_true",
+        help="write the rows removed by preprocessing (with reason) to removed_rows.parquet"
     )
     return p.parse_args()
 
@@ -49,38 +177,238 @@ def parse_args() -> argparse.Namespace:
 
 
 
+def _raw_available() -> bool:
+    return RAW_BORROWINGS_DIR.is_dir() and any(RAW_BORROWINGS_DIR.glob("borrowings_*.csv"))
+
+
+def _warn_if_stale(version: str, cache_dir: Path | None) -> None:
+    """
+    Compare the stored input fingerprint of a processed version with the current inputs.
+    Raw files are compared by size and mtime only (see compute_input_fingerprint).
+    """
+    if not _raw_available():
+        print("[main] raw data not available, cannot check whether the processed version is up to date")
+        return
+
+    stored = read_processed_metadata(PROCESSED_DIR, version).get("fingerprint")
+    if stored is not None and "raw_file_stats" not in stored:
+        print(f"[main] processed version '{version}' has no raw file stats, hashing raw files to check it")
+    current = compute_input_fingerprint(
+        RAW_BORROWINGS_DIR,
+        CLOSED_DAYS_FILE,
+        cache_dir=cache_dir,
+        lookup_files=LOOKUP_FILES,
+        reference=stored,
+    )
+    changed = diff_fingerprints(stored, current)
+    if changed:
+        print(f"[main] WARNING: processed version '{version}' is stale (changed: {', '.join(changed)})")
+
+
+def _new_raw_files(base_version: str, fingerprint: dict) -> list[str] | None:
+    """
+    Raw files added since base_version, or None if anything else changed
+    (modified raw files, closed days, config or code) and a full run is needed.
+    """
+    stored = read_processed_metadata(PROCESSED_DIR, base_version).get("fingerprint")
+    if stored is None:
+        print(f"[main] processed version '{base_version}' has no input fingerprint, running full pipeline")
+        return None
+
+    changed = [k for k in diff_fingerprints(stored, fingerprint) if k != "raw_files"]
+    old_files = stored["raw_files"]
+    modified = [
+        name for name, sha in fingerprint["raw_files"].items()
+        if name in old_files and old_files[name] != sha
+    ]
+    removed = [name for name in old_files if name not in fingerprint["raw_files"]]
+    if changed or modified or removed:
+        print(
+            f"[main] cannot append to '{base_version}' "
+            f"(changed: {', '.join(changed + modified + removed)}), running full pipeline"
+        )
+        return None
+
+    new_files = [name for name in fingerprint["raw_files"] if name not in old_files]
+    if not new_files:
+        print(f"[main] no raw files added since '{base_version}', running full pipeline")
+        return None
+    return new_files
+
+
+def _run_sweep(args: argparse.Namespace, cache_dir: Path | None) -> None:
+    """
+    Removed rows per year for the SWEEP_* threshold grids (no features, no plots),
+    written to SWEEP_DIR.
+    """
+    df_raw = load_borrowings_raw(
+        RAW_BORROWINGS_DIR,
+        workers=args.workers,
+        engine=args.csv_engine,
+        cache_dir=cache_dir,
+    )
+    sweep = sweep_cleaning_thresholds(
+        df_raw,
+        closed_days=load_closed_days(CLOSED_DAYS_FILE),
+        base_open_days=SWEEP_BASE_ALLOWED_OPEN_DAYS,
+        extensions_caps=SWEEP_MAX_EXTENSIONS_CAP,
+        remove_categories=SWEEP_REMOVE_USER_CATEGORIES,
+    )
+
+    out_path = SWEEP_DIR / "cleaning_sweep.csv"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    sweep.to_csv(out_path, sep=";", index=False)
+
+    params = ["remove_user_categories", "max_extensions_cap", "base_allowed_open_days"]
+    overall = sweep.groupby(params, sort=False)[["total", "removed_total"]].sum()
+    overall["removed_pct"] = (overall["removed_total"] / overall["total"] * 100.0).round(2)
+    print("[main] cleaning threshold sweep (all years):")
+    print(overall.to_string())
+    print(f"[main] saved sweep per year to: {out_path}")
+
+
 def main() -> None:
     args = parse_args()
-    cfg = PipelineConfig(raw_input=RAW_BORROWINGS_DIR, processed_version=args.version)
+    cache_dir = None if args.no_ingest_cache else INGEST_CACHE_DIR
+
+    if args.sweep:
+        _run_sweep(args, cache_dir)
+        return
+
+    version = resolve_processed_version(PROCESSED_DIR, args.version)
+    cfg = PipelineConfig(raw_input=RAW_BORROWINGS_DIR, processed_version=version)
+
+    # skip the pipeline if a processed version with identical inputs exists
+    fingerprint = None
+    reuse_version = None
+    if args.use_processed:
+        reuse_version = cfg.processed_version
+        _warn_if_stale(reuse_version, cache_dir)
+    else:
+        fingerprint = compute_input_fingerprint(
+            cfg.raw_input,
+            CLOSED_DAYS_FILE,
+            cache_dir=cache_dir,
+            lookup_files=LOOKUP_FILES,
+        )
+        if not args.force:
+            reuse_version = find_processed_version(
+                PROCESSED_DIR, fingerprint, prefer=cfg.processed_version
+            )
+            if reuse_version is not None:
+                print(f"[main] inputs unchanged, reusing processed version: {reuse_version}")
 
     # --------------------------------------------------
     # FAST PATH: load processed data only
     # --------------------------------------------------
-    if args.use_processed:
-        df_feat = load_processed_version(PROCESSED_DIR, args.version)
+    if reuse_version is not None:
+        df_feat = load_processed_version(
+            PROCESSED_DIR,
+            reuse_version,
+            columns=required_columns(),
+            years=args.years,
+        )
+        sessions = load_sessions(PROCESSED_DIR, reuse_version, years=args.years)
+        if sessions is None:
+            sessions = build_session_table(df_feat)
+        users = load_users(PROCESSED_DIR, reuse_version)
+        if users is None:
+            users = build_user_table(build_user_state(df_feat))
 
     # --------------------------------------------------
-    # FULL PIPELINE
+    # FULL PIPELINE (or incremental append)
     # --------------------------------------------------
     else:
-        # 1) load raw
-        df_raw = load_borrowings_raw(cfg.raw_input)
         closed = load_closed_days(CLOSED_DAYS_FILE)
+        lookups = {
+            "user_categories": load_user_categories(USER_CATEGORIES_FILE, cache_dir=LOOKUP_CACHE_DIR),
+            "collection_codes": load_collection_codes(COLLECTION_CODES_FILE, cache_dir=LOOKUP_CACHE_DIR),
+        }
+
+        audit_path = cfg.processed_out_dir / REMOVED_ROWS_NAME if args.audit_removed else None
+        if audit_path is not None and args.chunksize and args.append_to is None:
+            print("[main] --audit-removed is not supported with --chunksize, only counts are reported")
+
+        new_files = None
+        clean_tmp = None
+        if args.append_to is not None:
+            base_version = resolve_processed_version(PROCESSED_DIR, args.append_to)
+            new_files = _new_raw_files(base_version, fingerprint)
 
-        # 2) preprocess
-        df_clean = preprocess_borrowings(df_raw, closed_days=closed)
+        if new_files is not None:
+            # 1-3) previous version + only the new raw files, features updated per affected user
+            print(f"[main] appending {new_files} to processed version: {base_version}")
+            df_prev = load_processed_version(PROCESSED_DIR, base_version)
+            user_state = load_user_state(PROCESSED_DIR, base_version)
+            if user_state is None:
+                user_state = build_user_state(df_prev)
+
+            df_new = load_borrowings_raw(
+                cfg.raw_input,
+                workers=args.workers,
+                engine=args.csv_engine,
+                cache_dir=cache_dir,
+                only=new_files,
+            )
+            df_new = preprocess_borrowings(df_new, closed_days=closed, audit_path=audit_path)
+            df_new = add_lookup_columns(df_new, **lookups)
+            df_feat, user_state = add_features_incremental(df_prev, df_new, user_state)
+            del df_prev, df_new
+
+        elif args.chunksize:
+            # 1+2) stream raw chunks through the cleaning steps into a temporary parquet file
+            clean_tmp = tempfile.TemporaryDirectory(prefix="borrowings_clean_")
+            clean_path = Path(clean_tmp.name) / "borrowings_clean.parquet"
+            chunks = iter_borrowings_raw_chunks(
+                cfg.raw_input,
+                chunksize=args.chunksize,
+                engine=args.csv_engine,
+            )
+            write_parquet_chunks(
+                preprocess_borrowings_chunks(chunks, closed_days=closed),
+                clean_path,
+            )
+            df_clean = pd.read_parquet(clean_path)
+        else:
+            # 1) load raw
+            df_raw = load_borrowings_raw(
+                cfg.raw_input,
+                workers=args.workers,
+                engine=args.csv_engine,
+                cache_dir=cache_dir,
+            )
+
+            # 2) preprocess
+            df_clean = preprocess_borrowings(df_raw, closed_days=closed, audit_path=audit_path)
+            del df_raw
 
         # 3) features
-        df_feat = add_features(df_clean)
+        if new_files is None:
+            df_clean = add_lookup_columns(df_clean, **lookups)
+            df_feat = add_features(
+                df_clean,
+                cache_dir=FEATURE_CACHE_DIR if args.feature_cache else None,
+                workers=args.feature_workers,
+            )
+            user_state = build_user_state(df_feat)
+        if clean_tmp is not None:
+            clean_tmp.cleanup()
 
-        # 4) validate
-        validate_borrowings(df_feat)
+        # 4) session + user tables, validate
+        sessions = build_session_table(df_feat)
+        users = build_user_table(user_state)
+        validate_borrowings(df_feat, sessions)
 
         # 5) save processed
         save_processed(
             df_feat,
             cfg.processed_out_dir,
-            version=cfg.processed_version
+            version=cfg.processed_version,
+            ipc=args.ipc_cache,
+            fingerprint=fingerprint,
+            user_state=user_state,
+            sessions=sessions,
+            users=users,
         )
 
         print(f"[main] saved processed dataset to: {cfg.processed_out_dir}")
@@ -88,13 +416,13 @@ def main() -> None:
     # --------------------------------------------------
     # PLOTS
     # --------------------------------------------------
-    user_stats(df_feat)
-    print_media_type_stats(df_feat)
+    tables = {"sessions": sessions, "users": users}
+    for stats_fn, _, table_names in STATS:
+        stats_fn(df_feat, **{name: tables[name] for name in table_names})
+
     cfg.figures_out_dir.mkdir(parents=True, exist_ok=True)
-    plot1(df_feat, cfg.figures_out_dir / "plot_1_clock_plot.pdf")
-    plot2(df_feat, cfg.figures_out_dir / "plot_2_learning_curve.pdf")
-    plot3(df_feat, cfg.figures_out_dir / "plot_3_overview.pdf")
-    plot4(df_feat, cfg.figures_out_dir / "plot_4_media_type_stickiness.pdf")
+    for plot_fn, _, table_names, filename in PLOTS:
+        plot_fn(df_feat, cfg.figures_out_dir / filename, **{name: tables[name] for name in table_names})
 
 
 if __name__ == "__main__":
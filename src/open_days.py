@@ -0,0 +1,147 @@
+# src/open_days.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.config import (
+    CLOSED_DATE_COL,
+    BRANCH_COL,
+    LIB_WEEKMASK,
+)
+
+
+@dataclass(frozen=True)
+class OpenDayCalendar:
+    """
+    Cumulative open-day ordinals for a contiguous date span.
+
+    ordinals[row, i] = number of open days in [first_day, first_day + i), so the open
+    days in [start, end) are ordinals[end] - ordinals[start] (same as np.busday_count).
+    Row 0 pools the closed days of all branches, row k + 1 belongs to branches[k].
+    """
+    first_day: np.datetime64
+    branches: pd.Index
+    ordinals: np.ndarray
+
+    @property
+    def last_day(self) -> np.datetime64:
+        return self.first_day + (self.ordinals.shape[1] - 2)
+
+    def _rows(self, branch: pd.Series | None) -> np.ndarray | int:
+        # unknown or missing branch -> pooled calendar (row 0)
+        if branch is None:
+            return 0
+        codes, uniques = pd.factorize(np.asarray(branch, dtype=object))
+        rows = self.branches.get_indexer(_normalize_branch(pd.Index(uniques))) + 1
+        return np.append(rows, 0)[codes]  # code -1 (missing) -> last entry
+
+    def _offsets(self, days: np.ndarray) -> np.ndarray:
+        offsets = (days - self.first_day).astype("int64")
+        if offsets.size and (offsets.min() < 0 or offsets.max() > self.ordinals.shape[1] - 2):
+            raise ValueError(
+                f"dates outside the calendar span {self.first_day} .. {self.last_day}"
+            )
+        return offsets
+
+    def open_days_between(
+        self,
+        start: pd.Series,
+        end: pd.Series,
+        branch: pd.Series | None = None,
+    ) -> np.ndarray:
+        """
+        Open days in [start, end) per row (datetimes are normalized to days).
+        NaN where start/end is missing or end < start.
+        """
+        start_d = pd.to_datetime(start).to_numpy().astype("datetime64[D]")
+        end_d = pd.to_datetime(end).to_numpy().astype("datetime64[D]")
+        valid = (start_d == start_d) & (end_d == end_d) & (end_d >= start_d)
+
+        rows = self._rows(branch)
+        if not np.isscalar(rows):
+            rows = rows[valid]
+
+        open_days = np.full(len(start_d), np.nan, dtype="float64")
+        open_days[valid] = (
+            self.ordinals[rows, self._offsets(end_d[valid])]
+            - self.ordinals[rows, self._offsets(start_d[valid])]
+        )
+        return open_days
+
+
+def _normalize_branch(values):
+    # branch names as stripped strings, the same for closed days and loans
+    return values.astype(str).str.strip()
+
+
+def _closed_days_by_branch(closed_days: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parsed closed days as (branch, day) without duplicates; branch is NaN if the
+    file has no BRANCH_COL.
+    """
+    days = (
+        pd.to_datetime(closed_days[CLOSED_DATE_COL], dayfirst=True, errors="coerce")
+        .dt.normalize()
+    )
+    branch = (
+        _normalize_branch(closed_days[BRANCH_COL])
+        if BRANCH_COL in closed_days.columns
+        else pd.Series(np.nan, index=closed_days.index)
+    )
+    return (
+        pd.DataFrame({"branch": branch, "day": days})
+        .dropna(subset=["day"])
+        .drop_duplicates()
+    )
+
+
+def build_open_day_calendar(
+    closed_days: pd.DataFrame,
+    first_day,
+    last_day,
+    *,
+    weekmask: str = LIB_WEEKMASK,
+) -> OpenDayCalendar:
+    """
+    Build the open-day index for [first_day, last_day] from the weekmask and the
+    closed days: one row with all closed days pooled, plus one row per branch.
+    """
+    first = np.datetime64(pd.Timestamp(first_day).normalize().date(), "D")
+    last = np.datetime64(pd.Timestamp(last_day).normalize().date(), "D")
+    days = np.arange(first, last + 1, dtype="datetime64[D]")
+
+    closed = _closed_days_by_branch(closed_days)
+    closed_d = closed["day"].to_numpy().astype("datetime64[D]")
+    branches = pd.Index(sorted(closed["branch"].dropna().unique()))
+
+    def cumulative(holidays: np.ndarray) -> np.ndarray:
+        is_open = np.is_busday(days, weekmask=weekmask, holidays=np.unique(holidays))
+        return np.concatenate([[0], np.cumsum(is_open, dtype="int32")])
+
+    ordinals = np.vstack(
+        [cumulative(closed_d)]
+        + [cumulative(closed_d[closed["branch"].to_numpy() == b]) for b in branches]
+    )
+    return OpenDayCalendar(first_day=first, branches=branches, ordinals=ordinals)
+
+
+def build_open_day_calendar_for(
+    df: pd.DataFrame,
+    closed_days: pd.DataFrame,
+    date_cols: list[str],
+    *,
+    weekmask: str = LIB_WEEKMASK,
+) -> OpenDayCalendar:
+    """
+    build_open_day_calendar covering all dates in the given columns of df.
+    """
+    lows = [df[c].min() for c in date_cols]
+    highs = [df[c].max() for c in date_cols]
+    lows = [d for d in lows if pd.notna(d)]
+    highs = [d for d in highs if pd.notna(d)]
+    if not lows:
+        lows = highs = [pd.Timestamp.today()]
+    return build_open_day_calendar(closed_days, min(lows), max(highs), weekmask=weekmask)
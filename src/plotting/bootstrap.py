@@ -0,0 +1,88 @@
+# src/plotting/bootstrap.py
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+
+# memory budget for one block of resample weights (replicates x users), temporaries included
+BOOTSTRAP_BLOCK_BYTES = 64 * 2**20
+# peak bytes per (replicate, user) while building weights: two int64 arrays, then int64 + float64
+_WEIGHT_BYTES = 16
+
+
+def _resample_weights(rng: np.random.Generator, n_rows: int, n_users: int) -> np.ndarray:
+    """
+    (n_rows x n_users) multinomial weights: how often each user is drawn when resampling
+    n_users users with replacement. Built from rng.integers, so the draws are the same as
+    those of a per-replicate rng.integers(0, n_users, size=n_users) loop.
+    """
+    idx = rng.integers(0, n_users, size=(n_rows, n_users))
+    idx += np.arange(n_rows)[:, None] * n_users  # position in the flattened weights, in place
+    counts = np.bincount(idx.ravel(), minlength=n_rows * n_users)
+    del idx
+    return counts.reshape(n_rows, n_users).astype(float)
+
+
+def bootstrap_nanmean(
+    mats: Sequence[np.ndarray],
+    *,
+    n_boot: int = 1000,
+    rng: np.random.Generator | int | None = 42,
+    block_bytes: int = BOOTSTRAP_BLOCK_BYTES,
+) -> list[np.ndarray]:
+    """
+    User-level bootstrap of column means ignoring NaN.
+
+    mats: (users x K) matrices sharing the user rows (e.g. one per estimator); every
+    replicate resamples the users once and applies the draw to all matrices.
+    Returns one (n_boot x K) array of replicate means per matrix, NaN where a replicate
+    has no valid value in a column (like np.nanmean of the resampled rows).
+
+    Per-user values and valid counts are computed once; the replicates are weighted
+    sums (weights @ values / weights @ valid) in blocks whose weights, including the
+    temporaries needed to build them, take at most block_bytes.
+    rng may be a Generator (continued) or a seed.
+    """
+    rng = np.random.default_rng(rng) if not isinstance(rng, np.random.Generator) else rng
+    n_users = mats[0].shape[0]
+    if any(mat.shape[0] != n_users for mat in mats):
+        raise ValueError("all matrices must have the same number of user rows")
+
+    valid = [~np.isnan(mat) for mat in mats]
+    values = [np.where(ok, mat, 0.0) for mat, ok in zip(mats, valid)]
+    counts = [ok.astype(float) for ok in valid]
+
+    boot = [np.full((n_boot, mat.shape[1]), np.nan) for mat in mats]
+    if n_users == 0:
+        return boot
+
+    block = max(1, min(n_boot, block_bytes // (_WEIGHT_BYTES * n_users)))
+    for start in range(0, n_boot, block):
+        stop = min(start + block, n_boot)
+        weights = _resample_weights(rng, stop - start, n_users)
+        for out, v, c in zip(boot, values, counts):
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[start:stop] = (weights @ v) / (weights @ c)
+        del weights  # not alive while the next block is built
+
+    return boot
+
+
+def bootstrap_ci(
+    mats: Sequence[np.ndarray],
+    *,
+    n_boot: int = 1000,
+    alpha: float = 0.05,
+    rng: np.random.Generator | int | None = 42,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Percentile CI (lower, upper per column) of the user-level bootstrap of column means
+    (see bootstrap_nanmean), one per matrix.
+    """
+    cis = []
+    for boot in bootstrap_nanmean(mats, n_boot=n_boot, rng=rng):
+        lower = np.nanquantile(boot, alpha / 2, axis=0)
+        upper = np.nanquantile(boot, 1 - alpha / 2, axis=0)
+        cis.append((lower, upper))
+    return cis
@@ -11,33 +11,51 @@ from tueplots import bundles
 from tueplots.constants.color import rgb
 
 from src.plotting.style import apply_style
-from src.config import ISSUE_COL, USER_ID_COL, SESSION_INDEX_COL, USER_STD_HOUR_COL, WEEKDAY_COL, USER_MODAL_WEEKDAY_COL
-
-def print_user_statistics(df: pd.DataFrame):
+from src.preprocess import parse_timestamps
+from src.features import USER_STATE_COLUMNS, build_user_state, build_user_table
+from src.config import (
+    ISSUE_COL,
+    USER_ID_COL,
+    WEEKDAY_COL,
+    USER_STD_HOUR_COL,
+    USER_MODAL_WEEKDAY_COL,
+    USER_FREQUENT_COL,
+    MIN_FREQUENT_USER_SESSIONS,
+)
+
+# loan columns read by the functions below without a user table (used to project the processed dataset)
+USER_STATISTICS_COLUMNS = [USER_ID_COL, WEEKDAY_COL] + [c for c in USER_STATE_COLUMNS if c not in (USER_ID_COL, WEEKDAY_COL)]
+MAKE_PLOT_COLUMNS = [USER_ID_COL, ISSUE_COL]
+
+def print_user_statistics(df: pd.DataFrame, *, users: pd.DataFrame | None = None):
     """
     Calculate time-based statistics at user level
+
+    users: user table (features.build_user_table); built from df if not given.
     """
-   
+    if users is None:
+        users = build_user_table(build_user_state(df))
+    users = users[users[USER_ID_COL].isin(df[USER_ID_COL])].set_index(USER_ID_COL)
+
     is_tue_to_sat = df[WEEKDAY_COL].between(1, 5)  # Tue–Sat
-    user_sessions = df.groupby(USER_ID_COL)[SESSION_INDEX_COL].max()
-    frequent_user = user_sessions[user_sessions >= 10].index        # user with at least 10 sessions
+    frequent_user = users.index[users[USER_FREQUENT_COL]]    # user with at least MIN_FREQUENT_USER_SESSIONS sessions
 
-    df_user = df[is_tue_to_sat & df[USER_ID_COL].isin(frequent_user)].copy()
+    df_user = df.loc[is_tue_to_sat & df[USER_ID_COL].isin(frequent_user), [USER_ID_COL, WEEKDAY_COL]]
 
     # --- weekday preference ---
-    df_user["is_modal_day"] = (df_user[WEEKDAY_COL] == df_user[USER_MODAL_WEEKDAY_COL])
-    user_weekday_probs = df_user.groupby(USER_ID_COL)["is_modal_day"].mean()
+    is_modal_day = df_user[WEEKDAY_COL] == df_user[USER_ID_COL].map(users[USER_MODAL_WEEKDAY_COL])
+    user_weekday_probs = is_modal_day.groupby(df_user[USER_ID_COL]).mean()
     weekday_prob = user_weekday_probs.mean() * 100
 
     # --- standard deviation of the time ---
-    user_std_devs = df_user.groupby(USER_ID_COL)[USER_STD_HOUR_COL].first()
+    user_std_devs = users.loc[df_user[USER_ID_COL].unique(), USER_STD_HOUR_COL]
     mean_std_dev = user_std_devs.mean()
 
     # --- user with std < 1 ---
     precise_users_mask = user_std_devs < 1.0
     precise_percentage = precise_users_mask.mean() * 100
 
-    print(f"[stats] user with >= 10 sessions, n={len(frequent_user)}):")
+    print(f"[stats] user with >= {MIN_FREQUENT_USER_SESSIONS} sessions, n={len(frequent_user)}):")
     print(f"  1. Mean probability of returning on the same weekday: {weekday_prob:.1f}%")
     print(f"  2. Mean standard deviation of visit times: {mean_std_dev:.1f} hours")
     print(f"  3. Users with high temporal precision (<1h std): {precise_percentage:.1f}%")
@@ -153,7 +171,7 @@ def make_plot(df: pd.DataFrame, outpath) -> None:
     # -----------------------------
     df_plot = df.dropna(subset=[USER_ID_COL, ISSUE_COL]).copy()
     if not np.issubdtype(df_plot[ISSUE_COL].dtype, np.datetime64):
-        df_plot[ISSUE_COL] = pd.to_datetime(df_plot[ISSUE_COL], errors="coerce")
+        df_plot[ISSUE_COL] = parse_timestamps(df_plot[ISSUE_COL], verbose=False)
         df_plot = df_plot.dropna(subset=[ISSUE_COL])
 
     df_plot["weekday"] = df_plot[ISSUE_COL].dt.weekday  # Mon=0..Sun=6
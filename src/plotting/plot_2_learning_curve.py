@@ -12,16 +12,25 @@ from tueplots.constants.color import rgb
 
 from src.config import (
     USER_ID_COL,
+    ISSUE_SESSION_COL,
     SESSION_INDEX_COL,
     SESSION_LATE_FLAG_COL,
     SESSION_EXTENSION_FLAG_COL,
     MAX_SESSION_INDEX_PLOT,
     LEARNING_CURVE_SMOOTHING,
 )
+from src.features import build_session_table
+from src.plotting.bootstrap import bootstrap_ci
 from src.plotting.style import apply_style
 
+# loan columns read by make_plot without a session table (used to project the processed dataset)
+MAKE_PLOT_COLUMNS = [USER_ID_COL, ISSUE_SESSION_COL, SESSION_INDEX_COL, SESSION_LATE_FLAG_COL, SESSION_EXTENSION_FLAG_COL]
 
-def make_plot(df: pd.DataFrame, outpath) -> None:
+
+def make_plot(df: pd.DataFrame, outpath, *, sessions: pd.DataFrame | None = None) -> None:
+    """
+    sessions: session table (features.build_session_table); built from df if not given.
+    """
     apply_style()
     outpath = Path(outpath) if outpath is not None else None
     t0 = time.perf_counter()
@@ -29,13 +38,13 @@ def make_plot(df: pd.DataFrame, outpath) -> None:
     # --------------------------------------------------
     # Data (one row per user-session)
     # --------------------------------------------------
-    df_plot = df[df[SESSION_INDEX_COL].between(1, MAX_SESSION_INDEX_PLOT)].copy()
+    if sessions is None:
+        sessions = build_session_table(df)
     x = np.arange(1, MAX_SESSION_INDEX_PLOT + 1)
 
     df_sessions = (
-        df_plot
-        .dropna(subset=[USER_ID_COL, SESSION_INDEX_COL])
-        .drop_duplicates(subset=[USER_ID_COL, SESSION_INDEX_COL])
+        sessions[sessions[SESSION_INDEX_COL].between(1, MAX_SESSION_INDEX_PLOT)]
+        .astype({SESSION_LATE_FLAG_COL: float, SESSION_EXTENSION_FLAG_COL: float})
     )
 
     # --------------------------------------------------
@@ -88,22 +97,13 @@ def make_plot(df: pd.DataFrame, outpath) -> None:
         .reindex(columns=x)
     )
 
-    mat_late = df_us_late.to_numpy()
-    mat_ext = df_us_ext.to_numpy()
-    U = mat_late.shape[0]
-
-    boot_late = np.full((N_BOOT, len(x)), np.nan)
-    boot_ext = np.full((N_BOOT, len(x)), np.nan)
+    mat_late = df_us_late.to_numpy(dtype=float)
+    mat_ext = df_us_ext.to_numpy(dtype=float)
 
-    for b in range(N_BOOT):
-        idx = rng.integers(0, U, size=U)
-        boot_late[b] = np.nanmean(mat_late[idx], axis=0)
-        boot_ext[b] = np.nanmean(mat_ext[idx], axis=0)
-
-    late_lower = np.nanquantile(boot_late, ALPHA / 2, axis=0)
-    late_upper = np.nanquantile(boot_late, 1 - ALPHA / 2, axis=0)
-    ext_lower = np.nanquantile(boot_ext, ALPHA / 2, axis=0)
-    ext_upper = np.nanquantile(boot_ext, 1 - ALPHA / 2, axis=0)
+    # one user resample per replicate, shared by both curves
+    (late_lower, late_upper), (ext_lower, ext_upper) = bootstrap_ci(
+        [mat_late, mat_ext], n_boot=N_BOOT, alpha=ALPHA, rng=rng
+    )
 
     # --------------------------------------------------
     # Plot
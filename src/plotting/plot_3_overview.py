@@ -11,6 +11,10 @@ import pandas as pd
 
 from src.config import ISSUE_COL, EXTENSIONS_COL, PROCESSED_DIR
 from src.plotting.style import apply_style
+from src.preprocess import parse_timestamps
+
+# columns read by make_plot (used to project the processed dataset)
+MAKE_PLOT_COLUMNS = [ISSUE_COL]
 
 
 def make_plot(df: pd.DataFrame, outpath) -> None:
@@ -20,13 +24,13 @@ def make_plot(df: pd.DataFrame, outpath) -> None:
     
     # Load pre-cleaning data to calculate removed records
     pre_cleaning_file = PROCESSED_DIR / "borrowings_2019_2025.csv"
-    df_pre_clean = pd.read_csv(pre_cleaning_file, sep=";", encoding="utf-8")
-    df_pre_clean[ISSUE_COL] = pd.to_datetime(df_pre_clean[ISSUE_COL], errors='coerce')
+    df_pre_clean = pd.read_csv(pre_cleaning_file, sep=";", encoding="utf-8", usecols=[ISSUE_COL])
+    df_pre_clean[ISSUE_COL] = parse_timestamps(df_pre_clean[ISSUE_COL], verbose=False)
     df_pre_clean['year'] = df_pre_clean[ISSUE_COL].dt.year
     pre_clean_counts = df_pre_clean.groupby('year').size()
     
     df = df.copy()
-    df[ISSUE_COL] = pd.to_datetime(df[ISSUE_COL], errors='coerce')
+    df[ISSUE_COL] = parse_timestamps(df[ISSUE_COL], verbose=False)
     df['year'] = df[ISSUE_COL].dt.year
     
     years = sorted(df['year'].dropna().unique())
@@ -19,25 +19,32 @@ from src.config import (
     MAX_SESSION_INDEX_PLOT_4,
     SESSION_INDEX_COL,
     SESSION_CATEGORY_COL,
+    SESSION_MEDIA_TIE_COL,
+    SESSION_N_MEDIA_TYPES_COL,
     STICKINESS_CURVE_SMOOTHING,
 )
+from src.features import build_session_table
+from src.plotting.bootstrap import bootstrap_ci
 from src.plotting.style import apply_style
 
+# columns read by the functions below (used to project the processed dataset)
+MEDIA_TYPE_STATISTICS_COLUMNS = [USER_ID_COL, ISSUE_SESSION_COL, SESSION_INDEX_COL, MEDIA_TYPE_COL]
+MAKE_PLOT_COLUMNS = [USER_ID_COL, ISSUE_SESSION_COL, SESSION_INDEX_COL, MEDIA_TYPE_COL]
 
-def print_media_type_session_statistics(df: pd.DataFrame) -> None:
+
+def print_media_type_session_statistics(df: pd.DataFrame, *, sessions: pd.DataFrame | None = None) -> None:
     """
     Print media type specific statistics for user sessions:
     - tie-session rate (no unique dominant media type)
     - distribution of number of distinct media types per session (1..10)
+
+    sessions: session table (features.build_session_table); built from df if not given.
     """
     df_s = df.dropna(subset=[USER_ID_COL, ISSUE_SESSION_COL, MEDIA_TYPE_COL]).copy()
-
-    counts = (
-        df_s.groupby([USER_ID_COL, ISSUE_SESSION_COL, MEDIA_TYPE_COL])
-        .size()
-        .rename("n")
-        .reset_index()
-    )
+    if sessions is None:
+        sessions = build_session_table(df)
+    # sessions with at least one loan of known media type
+    sessions = sessions[sessions[SESSION_N_MEDIA_TYPES_COL] > 0]
 
     # ----------------------------
     # Overall media type distribution (loan-level)
@@ -58,24 +65,8 @@ def print_media_type_session_statistics(df: pd.DataFrame) -> None:
     # ----------------------------
     # Tie sessions (dominant not unique)
     # ----------------------------
-    max_per_session = (
-        counts.groupby([USER_ID_COL, ISSUE_SESSION_COL])["n"]
-        .max()
-        .rename("max_n")
-        .reset_index()
-    )
-
-    counts2 = counts.merge(max_per_session, on=[USER_ID_COL, ISSUE_SESSION_COL], how="left")
-    counts2["is_max"] = counts2["n"].eq(counts2["max_n"])
-
-    n_at_max = (
-        counts2.groupby([USER_ID_COL, ISSUE_SESSION_COL])["is_max"]
-        .sum()
-        .rename("n_tied_at_max")
-    )
-
-    n_sessions = int(n_at_max.shape[0])
-    n_tie_sessions = int((n_at_max > 1).sum())
+    n_sessions = int(len(sessions))
+    n_tie_sessions = int(sessions[SESSION_MEDIA_TIE_COL].sum())
     tie_rate = (n_tie_sessions / n_sessions * 100.0) if n_sessions else 0.0
 
     print(f"[plot4][stats] tie sessions: {n_tie_sessions}/{n_sessions} ({tie_rate:.2f}%)")
@@ -88,11 +79,7 @@ def print_media_type_session_statistics(df: pd.DataFrame) -> None:
 # ----------------------------
     # #distinct media types per session: P(m = 1..10)
     # ----------------------------
-    n_types = (
-        counts.groupby([USER_ID_COL, ISSUE_SESSION_COL])[MEDIA_TYPE_COL]
-        .nunique()
-        .rename("n_media_types")
-    )
+    n_types = sessions[SESSION_N_MEDIA_TYPES_COL].rename("n_media_types")
 
     max_k = 10
     pmf = (
@@ -118,7 +105,12 @@ def print_media_type_session_statistics(df: pd.DataFrame) -> None:
 def make_plot(
         df: pd.DataFrame,
         outpath,
+        *,
+        sessions: pd.DataFrame | None = None,
 ) -> None:
+    """
+    sessions: session table (features.build_session_table); built from df if not given.
+    """
     apply_style()
     outpath = Path(outpath) if outpath is not None else None
     t0 = time.perf_counter()
@@ -129,7 +121,9 @@ def make_plot(
     # Build session-level dominant category per user-session
     # (DROP TIES: sessions without a unique dominant media type)
     # --------------------------------------------------
-    session_top = _get_prepared_session_data(df_plot)
+    if sessions is None:
+        sessions = build_session_table(df)
+    session_top = _get_prepared_session_data(sessions)
     x_all = np.arange(1, MAX_SESSION_INDEX_PLOT_4 + 1)
 
     # --------------------------------------------------
@@ -143,20 +137,14 @@ def make_plot(
     cis: dict[int, tuple[np.ndarray, np.ndarray]] = {}
 
     def _bootstrap_ci(mat: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
-        U, K = mat.shape
-        boot = np.full((N_BOOT, K), np.nan)
-        for b in range(N_BOOT):
-            idx = rng.integers(0, U, size=U)
-            boot[b] = np.nanmean(mat[idx], axis=0)
-        lower = np.nanquantile(boot, ALPHA / 2, axis=0)
-        upper = np.nanquantile(boot, 1 - ALPHA / 2, axis=0)
-        return lower, upper
+        # rng is shared across k0, each call continues its stream
+        return bootstrap_ci([mat], n_boot=N_BOOT, alpha=ALPHA, rng=rng)[0]
 
     for k0 in FIRST_K_THRESHOLDS:
         base_loans = df_plot[df_plot[SESSION_INDEX_COL] <= k0].dropna(subset=[USER_ID_COL, MEDIA_TYPE_COL]).copy()
 
         uc = (
-            base_loans.groupby([USER_ID_COL, MEDIA_TYPE_COL])
+            base_loans.groupby([USER_ID_COL, MEDIA_TYPE_COL], observed=True)
             .size()
             .rename("n")
             .reset_index()
@@ -177,7 +165,8 @@ def make_plot(
         tmp = tmp.dropna(subset=[f"type_first_{k0}"]).copy()
 
         col_same = f"same_as_first_{k0}"
-        tmp[col_same] = (tmp[SESSION_CATEGORY_COL] == tmp[f"type_first_{k0}"])
+        # compared as objects: the session table and the loans may carry different category sets
+        tmp[col_same] = (tmp[SESSION_CATEGORY_COL].astype(object) == tmp[f"type_first_{k0}"].astype(object))
 
         # --- point estimate curve ---
         curve_k0 = (
@@ -294,41 +283,14 @@ def make_plot(
 
     print(f"[plot4] total time: {time.perf_counter() - t0:.2f}s")
 
-def _get_prepared_session_data(input_data: pd.DataFrame) -> pd.DataFrame:
-    # input_data ist loan-level und hat SESSION_INDEX_COL schon aus add_features
-    df_plot = input_data.dropna(subset=[USER_ID_COL, ISSUE_SESSION_COL, MEDIA_TYPE_COL, SESSION_INDEX_COL]).copy()
-
-    # session_index pro (user, session) aus dem Input übernehmen (konstant pro Session)
-    session_idx = (
-        df_plot.groupby([USER_ID_COL, ISSUE_SESSION_COL])[SESSION_INDEX_COL]
-        .first()
-        .reset_index()
-    )
-
-    # counts pro (user, session, media_type)
-    session_media = (
-        df_plot.groupby([USER_ID_COL, ISSUE_SESSION_COL, MEDIA_TYPE_COL])
-        .size()
-        .rename("n")
-        .reset_index()
-    )
-
-    # tie detection innerhalb der Session
-    session_media["n_max"] = session_media.groupby([USER_ID_COL, ISSUE_SESSION_COL])["n"].transform("max")
-    session_media["is_max"] = session_media["n"].eq(session_media["n_max"])
-    session_media["n_tied_at_max"] = session_media.groupby([USER_ID_COL, ISSUE_SESSION_COL])["is_max"].transform("sum")
-
-    dom = session_media[(session_media["is_max"]) & (session_media["n_tied_at_max"] == 1)].copy()
-
-    session_top = (
-        dom.rename(columns={MEDIA_TYPE_COL: SESSION_CATEGORY_COL})
-        [[USER_ID_COL, ISSUE_SESSION_COL, SESSION_CATEGORY_COL]]
-        .merge(session_idx, on=[USER_ID_COL, ISSUE_SESSION_COL], how="left")
-        .sort_values([USER_ID_COL, SESSION_INDEX_COL])
-    )
-
-    session_top = session_top[session_top[SESSION_INDEX_COL] <= MAX_SESSION_INDEX_PLOT_4].copy()
-    return session_top
+def _get_prepared_session_data(sessions: pd.DataFrame) -> pd.DataFrame:
+    # session table: dominant media type per user-session, ties (no unique dominant type) dropped
+    session_top = sessions.loc[
+        sessions[SESSION_CATEGORY_COL].notna()
+        & (sessions[SESSION_INDEX_COL] <= MAX_SESSION_INDEX_PLOT_4),
+        [USER_ID_COL, ISSUE_SESSION_COL, SESSION_CATEGORY_COL, SESSION_INDEX_COL],
+    ]
+    return session_top.sort_values([USER_ID_COL, SESSION_INDEX_COL])
 
 def _baseline_tie_rate_merged_borrowings(df_loans: pd.DataFrame, k0: int) -> tuple[int, int, float]:
     df0 = df_loans.dropna(subset=[USER_ID_COL, SESSION_INDEX_COL, MEDIA_TYPE_COL]).copy()
@@ -345,7 +307,7 @@ def _baseline_tie_rate_merged_borrowings(df_loans: pd.DataFrame, k0: int) -> tup
         return n_users, 0, 0.0
 
     uc = (
-        base.groupby([USER_ID_COL, MEDIA_TYPE_COL])
+        base.groupby([USER_ID_COL, MEDIA_TYPE_COL], observed=True)
         .size()
         .rename("n")
         .reset_index()
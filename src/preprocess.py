@@ -1,6 +1,12 @@
 # src/preprocess.py
 from __future__ import annotations
 
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+import time
+
 import numpy as np
 import pandas as pd
 
@@ -11,14 +17,18 @@ from src.config import (
     DAYS_LATE_COL,
     LATE_COL,
     EXTENSIONS_COL,
-    CLOSED_DATE_COL,
-    LIB_WEEKMASK,
+    BRANCH_COL,
     BASE_ALLOWED_OPEN_DAYS,
     MAX_EXTENSIONS_CAP,
     USER_CATEGORY_COL,
+    MEDIA_TYPE_COL,
+    COLLECTION_CODE_COL,
+    TOPIC_COL,
     SOURCE_YEAR_COL,
     REMOVE_USER_CATEGORIES,
+    RAW_TIMESTAMP_FORMATS,
 )
+from src.open_days import build_open_day_calendar_for
 
 
 def _get_year_series(df: pd.DataFrame) -> pd.Series:
@@ -38,77 +48,269 @@ def _get_year_series(df: pd.DataFrame) -> pd.Series:
     return pd.Series([pd.NA] * len(df), index=df.index, dtype="Int64")
 
 
-def _print_removed_by_year(removed_df: pd.DataFrame, reason: str) -> None:
+def _detect_timestamp_format(values: pd.Index, sample_size: int = 1000) -> str:
     """
-    Print removed counts per year for a single removal step.
+    The first RAW_TIMESTAMP_FORMATS entry that parses every string of (a sample of) the
+    given distinct strings, or "mixed" (per-string inference) if none of them does, so a
+    file with more than one format is not forced into the most frequent one.
     """
-    if removed_df.empty:
-        return
+    sample = values[:sample_size]
+    for fmt in RAW_TIMESTAMP_FORMATS:
+        if pd.to_datetime(sample, format=fmt, errors="coerce").notna().all():
+            return fmt
+    return "mixed"
+
+
+def parse_timestamps(
+    s: pd.Series,
+    *,
+    groups: pd.Series | None = None,
+    verbose: bool = True,
+) -> pd.Series:
+    """
+    Parse a timestamp string column (like pd.to_datetime(s, errors="coerce")).
 
-    y = _get_year_series(removed_df)
-    counts = (
-        removed_df.assign(_year=y)
-        .dropna(subset=["_year"])
-        .groupby("_year")
-        .size()
-        .sort_index()
-    )
+    Only the distinct strings are parsed and broadcast back via their codes; the format
+    is detected once per group (e.g. per source file / SOURCE_YEAR_COL) and used only if
+    it fits the whole sample; otherwise, and for strings it does not fit, pandas infers
+    the format per string. Strings that do not parse become NaT and are reported.
+    Datetime columns are returned unchanged.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
 
-    if counts.empty:
-        print(f"[preprocess] removed per year ({reason}): year unavailable")
-        return
+    codes, uniques = pd.factorize(s)
+    uniques = pd.Index(uniques).astype(str)
+    parsed = np.full(len(uniques), np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    if groups is None:
+        group_codes, n_groups = np.zeros(len(s), dtype="int64"), 1
+    else:
+        group_codes, group_values = pd.factorize(groups)
+        n_groups = len(group_values)
+
+    out = np.full(len(s), np.datetime64("NaT"), dtype="datetime64[ns]")
+    for g in range(n_groups):
+        rows = np.flatnonzero((group_codes == g) & (codes >= 0))
+        if len(rows) == 0:
+            continue
+        used = np.unique(codes[rows])
+
+        fmt = _detect_timestamp_format(uniques[used])
+        parsed[used] = pd.to_datetime(uniques[used], format=fmt, errors="coerce").to_numpy()
+        # strings outside the detection sample may still use another format
+        retry = used[np.isnat(parsed[used])]
+        if fmt != "mixed" and len(retry):
+            retried = pd.to_datetime(uniques[retry], format="mixed", errors="coerce")
+            parsed[retry] = retried.to_numpy()
+        out[rows] = parsed[codes[rows]]
+
+    if verbose:
+        failed = np.isnat(out) & (codes >= 0)
+        if failed.any():
+            examples = pd.unique(np.asarray(uniques)[codes[failed]])
+            shown = ", ".join(repr(x) for x in examples[:5])
+            print(
+                f"[preprocess] unparsed timestamps in {s.name}: {int(failed.sum())} rows "
+                f"({len(examples)} distinct), e.g. {shown}"
+            )
 
-    per_year = ", ".join(f"{int(year)}: {int(n)}" for year, n in counts.items())
-    print(f"[preprocess] removed per year ({reason}): {per_year}")
+    return pd.Series(out, index=s.index, name=s.name)
 
 
-def _drop_and_report(
-    df: pd.DataFrame,
-    remove_mask: pd.Series,
+# code columns whose values are whitespace-normalized during preprocessing
+NORMALIZE_CODE_COLS = (MEDIA_TYPE_COL, COLLECTION_CODE_COL, TOPIC_COL, USER_CATEGORY_COL)
+
+# raw spellings of the late flag (after strip + lower); anything else counts as not late
+LATE_VALUE_MAP = {
+    "1": True,
+    "0": False,
+    "true": True,
+    "false": False,
+    "ja": True,
+    "nein": False,
+}
+
+
+def normalize_categorical(
+    s: pd.Series,
+    *,
+    lower: bool = False,
+    mapping: dict | None = None,
+    default=None,
+    dtype: str = "category",
+) -> pd.Series:
+    """
+    Normalize a flag/code column on its distinct values instead of per row.
+
+    The column is split into codes + distinct values (the categories of a categorical,
+    pd.factorize otherwise). Each distinct value is converted to str, stripped (and
+    lowercased if lower) and, if mapping is given, mapped; the result is broadcast back
+    via the codes. Missing and (with mapping) unmapped values become default (NaN if None).
+
+    dtype "category" returns a categorical with sorted categories; any other dtype is
+    applied with astype (e.g. "bool" for flags, then default must not be None).
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes = s.cat.codes.to_numpy()
+        values = pd.Series(s.cat.categories, dtype=object)
+    else:
+        codes, uniques = pd.factorize(s)
+        values = pd.Series(uniques, dtype=object)
+
+    values = values.astype(str).str.strip()
+    if lower:
+        values = values.str.lower()
+    if mapping is not None:
+        values = values.map(mapping)
+    if default is not None:
+        values = values.where(values.notna(), default)
+
+    if dtype == "category":
+        categories = pd.Index(values.dropna().unique()).sort_values()
+        value_codes = categories.get_indexer(values)
+        default_code = categories.get_indexer([default])[0] if default is not None else -1
+        new_codes = np.where(codes >= 0, value_codes[codes] if len(values) else -1, default_code)
+        return pd.Series(
+            pd.Categorical.from_codes(new_codes, categories=categories),
+            index=s.index,
+            name=s.name,
+        )
+
+    out = values.to_numpy()[codes] if len(values) else np.empty(len(s), dtype=object)
+    out = np.where(codes >= 0, out, default if default is not None else np.nan)
+    return pd.Series(out, index=s.index, name=s.name).astype(dtype)
+
+
+# removal reason codes: 0 = kept, otherwise the first cleaning step that removed the row
+KEPT = 0
+REASON_MISSING_ISSUE = 1
+REASON_INVALID_ISSUE = 2
+REASON_MISSING_RETURN = 3
+REASON_RETURN_BEFORE_ISSUE = 4
+REASON_USER_CATEGORY = 5
+REASON_NEGATIVE_DURATION = 6
+REASON_NEGATIVE_DAYS_LATE = 7
+REASON_WEIRD_LOAN = 8
+
+# threads used for the independent column preparation steps and the cleaning rules
+RULE_WORKERS = 4
+
+
+@dataclass(frozen=True)
+class CleaningRule:
+    """
+    A row filter: rows where mask(df) is True are removed with reason code `code`.
+
+    The rule is skipped if one of `columns` is missing. Raw rules see the frame before
+    parsing/normalization, all others the prepared frame. mask must be row-local and
+    free of side effects (rules run concurrently). report(df, alive) may print extra
+    details; alive marks the rows not removed by an earlier rule.
+    """
+    code: int
+    reason: str
+    columns: tuple[str, ...]
+    mask: Callable[[pd.DataFrame], pd.Series | np.ndarray]
+    raw: bool = False
+    report: Callable[[pd.DataFrame, np.ndarray], None] | None = None
+
+
+# rules in precedence order: a row flagged by several rules counts for the first one
+CLEANING_RULES: list[CleaningRule] = []
+REMOVAL_REASONS: dict[int, str] = {}
+
+
+def register_rule(
+    code: int,
     reason: str,
-) -> tuple[pd.DataFrame, pd.DataFrame]:
+    columns: Iterable[str],
+    *,
+    raw: bool = False,
+    report: Callable[[pd.DataFrame, np.ndarray], None] | None = None,
+):
+    """
+    Decorator: add a mask function to CLEANING_RULES (after all rules registered so far).
     """
-    Drop rows where remove_mask is True, and print total removed + per-year breakdown.
-    Returns (new_df, removed_rows_df).
+    def decorator(fn: Callable[[pd.DataFrame], pd.Series | np.ndarray]):
+        if code in REMOVAL_REASONS or not KEPT < code <= np.iinfo(np.int8).max:
+            raise ValueError(f"invalid or duplicate removal reason code: {code}")
+        CLEANING_RULES.append(CleaningRule(code, reason, tuple(columns), fn, raw, report))
+        REMOVAL_REASONS[code] = reason
+        return fn
+
+    return decorator
+
+
+REMOVAL_REASON_COL = "removal_reason"
+
+
+def _year_codes(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Year of each row as index into the sorted unique years (-1 = no year).
+    Returns (codes, years).
     """
-    remove_mask = remove_mask.fillna(False)
-    if not bool(remove_mask.any()):
-        return df, pd.DataFrame(columns=df.columns)
+    codes, years = pd.factorize(_get_year_series(df), sort=True)
+    return codes, np.asarray(years, dtype="int64")
 
-    removed_rows = df.loc[remove_mask].copy()
-    df = df.loc[~remove_mask].copy()
 
-    print(f"[preprocess] removed {len(removed_rows)} rows: {reason}")
-    _print_removed_by_year(removed_rows, reason)
-    return df, removed_rows
+def _count_per_year(year_codes: np.ndarray, n_years: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """
+    Row counts per year index (rows without a year are ignored).
+    """
+    codes = year_codes if mask is None else year_codes[mask]
+    return np.bincount(codes[codes >= 0], minlength=n_years)
 
 
-def _print_total_removed_summary(df_start: pd.DataFrame, removed_all: pd.DataFrame) -> None:
+def _count_by_reason_and_year(reasons: np.ndarray, df: pd.DataFrame) -> pd.DataFrame:
     """
-    Print total removed rows per year: absolute and percent of original rows per year.
+    Removed rows per (reason code, year) as a frame: index reason code, columns year.
+    Reasons without removed rows are left out; rows without year are not counted.
     """
-    if removed_all.empty:
-        print("[preprocess] total removed summary per year: none removed")
+    year_codes, years = _year_codes(df)
+    n_years = len(years)
+
+    # rows without year get an extra year slot that is dropped afterwards
+    slot = np.where(year_codes >= 0, year_codes, n_years)
+    counts = np.bincount(
+        reasons.astype("int64") * (n_years + 1) + slot,
+        minlength=(max(REMOVAL_REASONS) + 1) * (n_years + 1),
+    ).reshape(-1, n_years + 1)
+
+    per_reason = counts.sum(axis=1)
+    removed = [code for code in REMOVAL_REASONS if per_reason[code] > 0]
+    return pd.DataFrame(counts[removed, :n_years], index=removed, columns=years)
+
+
+def _print_removed(n_removed: int, per_year: pd.Series, reason: str) -> None:
+    """
+    Print total removed + per-year breakdown for a single removal step.
+    """
+    print(f"[preprocess] removed {n_removed} rows: {reason}")
+
+    per_year = per_year[per_year > 0]
+    if per_year.empty:
+        print(f"[preprocess] removed per year ({reason}): year unavailable")
         return
 
-    start_year = _get_year_series(df_start)
-    removed_year = _get_year_series(removed_all)
+    per_year_str = ", ".join(f"{int(year)}: {int(n)}" for year, n in per_year.sort_index().items())
+    print(f"[preprocess] removed per year ({reason}): {per_year_str}")
 
-    total_per_year = (
-        df_start.assign(_year=start_year)
-        .dropna(subset=["_year"])
-        .groupby("_year")
-        .size()
-        .sort_index()
-    )
 
-    removed_per_year = (
-        removed_all.assign(_year=removed_year)
-        .dropna(subset=["_year"])
-        .groupby("_year")
-        .size()
-        .sort_index()
-    )
+def _count_by_year(df: pd.DataFrame) -> pd.Series:
+    """
+    Row counts per year (rows without a year are ignored).
+    """
+    year_codes, years = _year_codes(df)
+    return pd.Series(_count_per_year(year_codes, len(years)), index=years)
+
+
+def _print_total_removed_counts(total_per_year: pd.Series, removed_per_year: pd.Series) -> None:
+    """
+    Print the per-year summary from precomputed counts (year -> rows).
+    """
+    if int(removed_per_year.sum()) == 0:
+        print("[preprocess] total removed summary per year: none removed")
+        return
 
     print("[preprocess] total removed summary per year (count / total = percent):")
     for year in total_per_year.index:
@@ -118,74 +320,363 @@ def _print_total_removed_summary(df_start: pd.DataFrame, removed_all: pd.DataFra
         print(f"  {int(year)}: {removed}/{total} ({pct:.2f}%)")
 
 
-def _remove_weird_loans_using_closed_days(df: pd.DataFrame, closed_days: pd.DataFrame,) -> tuple[pd.DataFrame, pd.DataFrame]:
+@dataclass(frozen=True)
+class PrepareStep:
     """
-    Flags weird loans where open business days (Tue–Sat, excluding holidays/closed days)
-    exceed allowed maximum: BASE_ALLOWED_OPEN_DAYS * (1 + extensions),
-    with extensions capped at MAX_EXTENSIONS_CAP.
+    Derives columns the cleaning rules read: derive(df, closed_days, verbose) returns
+    {column: values} for the columns in `derives` that it could compute (possibly none).
 
-    Removes ONLY those weird loans that are NOT late (Verspätet == False).
-    Keeps weird loans that are late.
+    Steps reading a column another step derives run after that step; all others run
+    concurrently (derive must not modify df, the results are assigned afterwards).
+    """
+    name: str
+    columns: tuple[str, ...]
+    derives: tuple[str, ...]
+    derive: Callable[[pd.DataFrame, pd.DataFrame | None, bool], dict]
 
-    Returns (new_df, removed_rows_df).
+
+# column preparation in assignment order (see _prepare_columns)
+PREPARE_STEPS: list[PrepareStep] = []
+
+
+def register_prepare_step(name: str, columns: Iterable[str], derives: Iterable[str]):
     """
-    if EXTENSIONS_COL not in df.columns:
-        print(f"[preprocess] skip weird-loan rule: missing column {EXTENSIONS_COL}")
-        return df, pd.DataFrame(columns=df.columns)
+    Decorator: add a derive function to PREPARE_STEPS.
+    """
+    def decorator(fn: Callable[[pd.DataFrame, pd.DataFrame | None, bool], dict]):
+        PREPARE_STEPS.append(PrepareStep(name, tuple(columns), tuple(derives), fn))
+        return fn
 
+    return decorator
+
+
+def _timestamp_groups(df: pd.DataFrame) -> pd.Series | None:
+    # format detected per source file
+    return df[SOURCE_YEAR_COL] if SOURCE_YEAR_COL in df.columns else None
+
+
+@register_prepare_step(f"parse {ISSUE_COL}", [ISSUE_COL], [ISSUE_COL])
+def _prepare_issue(df: pd.DataFrame, closed_days: pd.DataFrame | None, verbose: bool) -> dict:
+    return {ISSUE_COL: parse_timestamps(df[ISSUE_COL], groups=_timestamp_groups(df), verbose=verbose)}
+
+
+@register_prepare_step(f"parse {RETURN_COL}", [RETURN_COL], [RETURN_COL])
+def _prepare_return(df: pd.DataFrame, closed_days: pd.DataFrame | None, verbose: bool) -> dict:
+    if RETURN_COL not in df.columns:
+        return {}
+    return {RETURN_COL: parse_timestamps(df[RETURN_COL], groups=_timestamp_groups(df), verbose=verbose)}
+
+
+@register_prepare_step("normalize code columns", NORMALIZE_CODE_COLS, NORMALIZE_CODE_COLS)
+def _prepare_codes(df: pd.DataFrame, closed_days: pd.DataFrame | None, verbose: bool) -> dict:
+    # strip whitespace, once per distinct value
+    return {col: normalize_categorical(df[col]) for col in NORMALIZE_CODE_COLS if col in df.columns}
+
+
+@register_prepare_step(
+    "numeric columns", [LOAN_DURATION_COL, DAYS_LATE_COL], [LOAN_DURATION_COL, DAYS_LATE_COL]
+)
+def _prepare_numeric(df: pd.DataFrame, closed_days: pd.DataFrame | None, verbose: bool) -> dict:
+    out = {}
+    if LOAN_DURATION_COL in df.columns:
+        out[LOAN_DURATION_COL] = pd.to_numeric(df[LOAN_DURATION_COL], errors="coerce")
+    if DAYS_LATE_COL in df.columns:
+        out[DAYS_LATE_COL] = pd.to_numeric(df[DAYS_LATE_COL], errors="coerce").fillna(0)
+    return out
+
+
+@register_prepare_step(f"normalize {LATE_COL}", [LATE_COL], [LATE_COL])
+def _prepare_late(df: pd.DataFrame, closed_days: pd.DataFrame | None, verbose: bool) -> dict:
     if LATE_COL not in df.columns:
-        print(f"[preprocess] skip weird-loan rule: missing column {LATE_COL}")
-        return df, pd.DataFrame(columns=df.columns)
-
-    holidays = (
-        pd.to_datetime(closed_days[CLOSED_DATE_COL], dayfirst=True, errors="coerce")
-        .dropna()
-        .dt.normalize()
-        .drop_duplicates()
-        .values.astype("datetime64[D]")
+        return {}
+    # missing/unknown treated as not late
+    late = normalize_categorical(
+        df[LATE_COL], lower=True, mapping=LATE_VALUE_MAP, default=False, dtype="bool"
     )
+    if verbose:
+        print(f"[preprocess] normalized column: {LATE_COL}")
+    return {LATE_COL: late}
 
-    start = df[ISSUE_COL].dt.normalize().values.astype("datetime64[D]")
-    end = df[RETURN_COL].dt.normalize().values.astype("datetime64[D]")
-
-    valid = (start == start) & (end == end) & (end >= start)
 
-    open_days = np.full(len(df), np.nan, dtype="float64")
-    open_days[valid] = np.busday_count(
-        start[valid],
-        end[valid],  # counts in [start, end)
-        weekmask=LIB_WEEKMASK,
-        holidays=holidays,
-    ).astype("float64")
+@register_prepare_step(
+    "weird-loan columns (open days)",
+    [ISSUE_COL, RETURN_COL, EXTENSIONS_COL, BRANCH_COL],
+    ["open_days_leihdauer", "max_allowed_open_days", "weird_loan"],
+)
+def _prepare_weird_loan(df: pd.DataFrame, closed_days: pd.DataFrame | None, verbose: bool) -> dict:
+    """
+    Flags weird loans where open business days (Tue–Sat, excluding holidays/closed days,
+    per branch if df has BRANCH_COL) exceed allowed maximum: BASE_ALLOWED_OPEN_DAYS * (1 + extensions),
+    with extensions capped at MAX_EXTENSIONS_CAP.
 
-    df = df.copy()
-    df["open_days_leihdauer"] = open_days
+    Derives the columns open_days_leihdauer, max_allowed_open_days and weird_loan;
+    the removal itself is the weird-loan rule below.
+    """
+    if LATE_COL not in df.columns:
+        return {}
+    if closed_days is None:
+        if verbose:
+            print("[preprocess] skip weird-loan rule: closed_days not provided")
+        return {}
+    if EXTENSIONS_COL not in df.columns:
+        if verbose:
+            print(f"[preprocess] skip weird-loan rule: missing column {EXTENSIONS_COL}")
+        return {}
+
+    calendar = build_open_day_calendar_for(df, closed_days, [ISSUE_COL, RETURN_COL])
+    open_days = calendar.open_days_between(
+        df[ISSUE_COL],
+        df[RETURN_COL],  # counts in [start, end)
+        df[BRANCH_COL] if BRANCH_COL in df.columns else None,
+    )
+    open_days = pd.Series(open_days, index=df.index)
 
     ext = (
         pd.to_numeric(df[EXTENSIONS_COL], errors="coerce")
         .fillna(0)
         .clip(lower=0, upper=MAX_EXTENSIONS_CAP)
     )
-    df["max_allowed_open_days"] = BASE_ALLOWED_OPEN_DAYS * (1 + ext)
+    max_allowed = BASE_ALLOWED_OPEN_DAYS * (1 + ext)
+
+    return {
+        "open_days_leihdauer": open_days,
+        "max_allowed_open_days": max_allowed,
+        "weird_loan": (open_days > max_allowed).fillna(False),
+    }
+
+
+def _prepare_columns(
+    df: pd.DataFrame,
+    *,
+    closed_days: pd.DataFrame | None,
+    workers: int = RULE_WORKERS,
+    verbose: bool = True,
+) -> list[tuple[str, float]]:
+    """
+    Parse, normalize and derive the columns the cleaning rules read (in place).
+
+    PREPARE_STEPS run in waves: every step whose input columns no other pending step
+    derives runs in the current wave, concurrently with the others.
+    Returns [(step name, seconds), ...] in registry order.
+    """
+    def run(step: PrepareStep) -> tuple[dict, float]:
+        t0 = time.perf_counter()
+        derived = step.derive(df, closed_days, verbose)
+        return derived, time.perf_counter() - t0
+
+    pending = list(PREPARE_STEPS)
+    seconds: dict[str, float] = {}
+    while pending:
+        wave = [
+            step
+            for step in pending
+            if not any(set(step.columns) & set(other.derives) for other in pending if other is not step)
+        ]
+        if not wave:
+            raise RuntimeError(f"cyclic column dependencies between {[s.name for s in pending]}")
+
+        if workers > 1 and len(wave) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(run, wave))
+        else:
+            results = [run(step) for step in wave]
+
+        for step, (derived, step_seconds) in zip(wave, results):
+            for col, values in derived.items():
+                df[col] = values
+            seconds[step.name] = step_seconds
+        pending = [step for step in pending if step not in wave]
 
-    df["weird_loan"] = (df["open_days_leihdauer"] > df["max_allowed_open_days"]).fillna(False)
+    return [(step.name, seconds[step.name]) for step in PREPARE_STEPS]
 
-    weird_mask = df["weird_loan"].fillna(False)
-    n_weird = int(weird_mask.sum())
 
+# --------------------------------------------------
+# cleaning rules (registration order = precedence)
+# --------------------------------------------------
+
+@register_rule(REASON_MISSING_ISSUE, f"missing {ISSUE_COL}", [ISSUE_COL], raw=True)
+def _rule_missing_issue(df: pd.DataFrame) -> pd.Series:
+    # before parsing
+    return df[ISSUE_COL].isna()
+
+
+@register_rule(REASON_INVALID_ISSUE, f"invalid {ISSUE_COL}", [ISSUE_COL])
+def _rule_invalid_issue(df: pd.DataFrame) -> pd.Series:
+    # after parsing
+    return df[ISSUE_COL].isna()
+
+
+@register_rule(REASON_MISSING_RETURN, f"missing {RETURN_COL}", [RETURN_COL])
+def _rule_missing_return(df: pd.DataFrame) -> pd.Series:
+    return df[RETURN_COL].isna()
+
+
+@register_rule(REASON_RETURN_BEFORE_ISSUE, "return before issue", [ISSUE_COL, RETURN_COL])
+def _rule_return_before_issue(df: pd.DataFrame) -> pd.Series:
+    return df[RETURN_COL] < df[ISSUE_COL]
+
+
+@register_rule(
+    REASON_USER_CATEGORY,
+    f"{USER_CATEGORY_COL} in {sorted(set(REMOVE_USER_CATEGORIES))}",
+    [USER_CATEGORY_COL],
+)
+def _rule_user_category(df: pd.DataFrame) -> pd.Series:
+    return df[USER_CATEGORY_COL].isin(set(REMOVE_USER_CATEGORIES))
+
+
+@register_rule(REASON_NEGATIVE_DURATION, f"negative {LOAN_DURATION_COL}", [LOAN_DURATION_COL])
+def _rule_negative_duration(df: pd.DataFrame) -> pd.Series:
+    return df[LOAN_DURATION_COL].notna() & (df[LOAN_DURATION_COL] < 0)
+
+
+@register_rule(REASON_NEGATIVE_DAYS_LATE, f"negative {DAYS_LATE_COL}", [DAYS_LATE_COL])
+def _rule_negative_days_late(df: pd.DataFrame) -> pd.Series:
+    return df[DAYS_LATE_COL] < 0
+
+
+def _report_weird_loans(df: pd.DataFrame, alive: np.ndarray) -> None:
+    weird = df["weird_loan"].to_numpy(dtype=bool) & alive
+    n_weird = int(weird.sum())
     if n_weird > 0:
-        late_rate_weird = float(df.loc[weird_mask, LATE_COL].mean())
+        late_rate_weird = float(df[LATE_COL].to_numpy(dtype=bool)[weird].mean())
         print(f"[preprocess] weird_loan flagged: {n_weird} rows (late-share among weird: {late_rate_weird:.3f})")
     else:
         print("[preprocess] weird_loan flagged: 0 rows")
 
-    remove_mask = weird_mask & (~df[LATE_COL].fillna(False))
-    df, removed_rows = _drop_and_report(df, remove_mask, f"weird_loan & {LATE_COL} == False")
 
-    return df, removed_rows
+@register_rule(
+    REASON_WEIRD_LOAN,
+    f"weird_loan & {LATE_COL} == False",
+    ["weird_loan", LATE_COL],
+    report=_report_weird_loans,
+)
+def _rule_weird_loan(df: pd.DataFrame) -> np.ndarray:
+    # weird loans that are late are kept
+    return df["weird_loan"].to_numpy(dtype=bool) & ~df[LATE_COL].to_numpy(dtype=bool)
+
+
+def _as_bool_mask(mask: pd.Series | np.ndarray) -> np.ndarray:
+    if isinstance(mask, pd.Series):
+        return mask.fillna(False).to_numpy(dtype=bool)
+    return np.asarray(mask, dtype=bool)
+
+
+def _evaluate_rules(
+    raw: pd.DataFrame,
+    df: pd.DataFrame,
+    *,
+    workers: int = RULE_WORKERS,
+    verbose: bool = True,
+) -> list[tuple[CleaningRule, np.ndarray, float]]:
+    """
+    Evaluate all applicable rules concurrently on the same frames.
+    Returns [(rule, mask, seconds), ...] in registry order.
+    """
+    rules = []
+    for rule in CLEANING_RULES:
+        frame = raw if rule.raw else df
+        missing = [col for col in rule.columns if col not in frame.columns]
+        if missing:
+            if verbose:
+                print(f"[preprocess] skip rule ({rule.reason}): missing column {missing[0]}")
+            continue
+        rules.append(rule)
+
+    def run(rule: CleaningRule) -> tuple[np.ndarray, float]:
+        t0 = time.perf_counter()
+        mask = _as_bool_mask(rule.mask(raw if rule.raw else df))
+        return mask, time.perf_counter() - t0
+
+    if workers > 1 and len(rules) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run, rules))
+    else:
+        results = [run(rule) for rule in rules]
+
+    return [(rule, mask, seconds) for rule, (mask, seconds) in zip(rules, results)]
 
 
-def preprocess_borrowings(df: pd.DataFrame, *, closed_days: pd.DataFrame) -> pd.DataFrame:
+def _apply_cleaning_steps(
+    df: pd.DataFrame,
+    *,
+    closed_days: pd.DataFrame | None,
+    verbose: bool = True,
+    workers: int = RULE_WORKERS,
+) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Run all row-local cleaning rules (CLEANING_RULES) on df (the full dataset or one chunk).
+
+    No rows are dropped here: each row gets the reason code of the first rule (in
+    registry order) that flags it, in one int8 array. Normalized and parsed columns are
+    replaced in df itself, so pass a (shallow) copy if the input must stay intact.
+    Returns (df, reasons) with reasons == KEPT for the rows that survive.
+    """
+    raw = df.copy(deep=False)
+    prepare_timings = _prepare_columns(df, closed_days=closed_days, workers=workers, verbose=verbose)
+
+    results = _evaluate_rules(raw, df, workers=workers, verbose=verbose)
+
+    reasons = np.zeros(len(df), dtype="int8")
+    if verbose:
+        year_codes, years = _year_codes(df)
+
+    timings = []
+    for rule, mask, seconds in results:
+        alive = reasons == KEPT
+        if verbose and rule.report is not None:
+            rule.report(df, alive)
+
+        removed = mask & alive
+        reasons[removed] = rule.code
+        timings.append((rule.reason, int(mask.sum()), int(removed.sum()), seconds))
+
+        if verbose and removed.any():
+            per_year = pd.Series(_count_per_year(year_codes, len(years), removed), index=years)
+            _print_removed(int(removed.sum()), per_year, rule.reason)
+
+    if verbose:
+        print("[preprocess] column preparation (ms):")
+        for name, seconds in prepare_timings:
+            print(f"  {name}: {seconds * 1000:.1f}")
+        print("[preprocess] cleaning rules (flagged / removed / ms):")
+        for reason, n_flagged, n_removed, seconds in timings:
+            print(f"  {reason}: {n_flagged} / {n_removed} / {seconds * 1000:.1f}")
+
+    return df, reasons
+
+
+def _take_kept(df: pd.DataFrame, reasons: np.ndarray) -> pd.DataFrame:
+    """
+    Single final filter: rows with reasons == KEPT, with a fresh RangeIndex.
+    """
+    kept = df.take(np.flatnonzero(reasons == KEPT))
+    kept.index = pd.RangeIndex(len(kept))
+    return kept
+
+
+def _write_removed_audit(df: pd.DataFrame, reasons: np.ndarray, path: Path) -> None:
+    """
+    Write the removed rows plus their REMOVAL_REASON_COL to a parquet sidecar.
+    """
+    removed_idx = np.flatnonzero(reasons != KEPT)
+    removed = df.take(removed_idx)
+    removed[REMOVAL_REASON_COL] = pd.Categorical(
+        [REMOVAL_REASONS[code] for code in reasons[removed_idx]],
+        categories=list(REMOVAL_REASONS.values()),
+    )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    removed.to_parquet(path, index=False)
+    print(f"[preprocess] wrote {len(removed)} removed rows to: {path}")
+
+
+def preprocess_borrowings(
+    df: pd.DataFrame,
+    *,
+    closed_days: pd.DataFrame,
+    audit_path: Path | None = None,
+) -> pd.DataFrame:
     """
     Clean and validate the borrowings dataset.
 
@@ -201,105 +692,162 @@ def preprocess_borrowings(df: pd.DataFrame, *, closed_days: pd.DataFrame) -> pd.
 
     Prints per-step removed counts + per-year breakdown and a final total per-year summary
     including percentage of original rows per year.
+
+    Every step only records a removal reason per row; the rows are filtered once at the
+    end, so df is not copied per step. If audit_path is given, the removed rows and their
+    reason are written there as parquet.
     """
-    df = df.copy()
-    df_start = df.copy()
-    removed_all_steps: list[pd.DataFrame] = []
+    # shallow copy: parsed columns are replaced, the caller's frame stays untouched
+    df = df.copy(deep=False)
 
     n_start = len(df)
     print(f"[preprocess] start rows: {n_start}")
 
-    # drop missing issue date (before parsing)
-    if ISSUE_COL in df.columns:
-        df, removed = _drop_and_report(df, df[ISSUE_COL].isna(), f"missing {ISSUE_COL}")
-        if not removed.empty:
-            removed_all_steps.append(removed)
-
-    # parse datetimes
-    df[ISSUE_COL] = pd.to_datetime(df[ISSUE_COL], errors="coerce")
-    df[RETURN_COL] = pd.to_datetime(df[RETURN_COL], errors="coerce")
-
-    # drop invalid issue date (after parsing)
-    df, removed = _drop_and_report(df, df[ISSUE_COL].isna(), f"invalid {ISSUE_COL}")
-    if not removed.empty:
-        removed_all_steps.append(removed)
-
-    # drop rows without return timestamp
-    df, removed = _drop_and_report(df, df[RETURN_COL].isna(), f"missing {RETURN_COL}")
-    if not removed.empty:
-        removed_all_steps.append(removed)
-
-    # remove impossible return dates
-    df, removed = _drop_and_report(df, df[RETURN_COL] < df[ISSUE_COL], "return before issue")
-    if not removed.empty:
-        removed_all_steps.append(removed)
-
-    # remove user categories from config
-    if USER_CATEGORY_COL in df.columns:
-        cats = df[USER_CATEGORY_COL].astype(str).str.strip()
-        df, removed = _drop_and_report(
-            df,
-            cats.isin(set(REMOVE_USER_CATEGORIES)),
-            f"{USER_CATEGORY_COL} in {sorted(set(REMOVE_USER_CATEGORIES))}",
-        )
-        if not removed.empty:
-            removed_all_steps.append(removed)
-    else:
-        print(f"[preprocess] skip user-category filter: missing column {USER_CATEGORY_COL}")
+    df, reasons = _apply_cleaning_steps(df, closed_days=closed_days)
 
-    # numeric sanity
-    # remove negative loan durations
-    if LOAN_DURATION_COL in df.columns:
-        df[LOAN_DURATION_COL] = pd.to_numeric(df[LOAN_DURATION_COL], errors="coerce")
-        neg_dur = df[LOAN_DURATION_COL].notna() & (df[LOAN_DURATION_COL] < 0)
-        df, removed = _drop_and_report(df, neg_dur, f"negative {LOAN_DURATION_COL}")
-        if not removed.empty:
-            removed_all_steps.append(removed)
+    # final total removed per-year summary (absolute + %)
+    year_codes, years = _year_codes(df)
+    _print_total_removed_counts(
+        pd.Series(_count_per_year(year_codes, len(years)), index=years),
+        pd.Series(_count_per_year(year_codes, len(years), reasons != KEPT), index=years),
+    )
 
-    if DAYS_LATE_COL in df.columns:
-        df[DAYS_LATE_COL] = pd.to_numeric(df[DAYS_LATE_COL], errors="coerce").fillna(0)
-        df, removed = _drop_and_report(df, df[DAYS_LATE_COL] < 0, f"negative {DAYS_LATE_COL}")
-        if not removed.empty:
-            removed_all_steps.append(removed)
-
-    # late flag normalization + weird-loan rule
-    # remove 
-    if LATE_COL in df.columns:
-        df[LATE_COL] = (
-            df[LATE_COL]
-            .astype(str)
-            .str.strip()
-            .str.lower()
-            .map(
-                {
-                    "1": True,
-                    "0": False,
-                    "true": True,
-                    "false": False, 
-                    "ja": True,
-                    "nein": False,
-                }
-            )
-            .fillna(False) # Missing/unknown treated as not late
-            .astype(bool)
+    if audit_path is not None:
+        _write_removed_audit(df, reasons, audit_path)
+
+    df = _take_kept(df, reasons)
+    print(f"[preprocess] final rows: {len(df)} (removed {n_start - len(df)} total)")
+    return df
+
+
+def sweep_cleaning_thresholds(
+    df: pd.DataFrame,
+    *,
+    closed_days: pd.DataFrame,
+    base_open_days: Iterable[float],
+    extensions_caps: Iterable[int],
+    remove_categories: Iterable[Iterable[str]],
+) -> pd.DataFrame:
+    """
+    Removed rows per year for every combination of BASE_ALLOWED_OPEN_DAYS,
+    MAX_EXTENSIONS_CAP and REMOVE_USER_CATEGORIES candidates.
+
+    Columns are prepared and the other rules evaluated once. Per category set and
+    extension cap, the weird-loan rule reduces to open_days / (1 + ext) > base; the
+    ratio is bucketed against all sorted base values at once (searchsorted) and counted
+    per year with bincount, so the base grid costs no extra pass.
+    Returns one row per (remove_user_categories, max_extensions_cap,
+    base_allowed_open_days, source_year).
+    """
+    df = df.copy(deep=False)
+    raw = df.copy(deep=False)
+    _prepare_columns(df, closed_days=closed_days, verbose=False)
+    for col in ("open_days_leihdauer", EXTENSIONS_COL, LATE_COL, USER_CATEGORY_COL):
+        if col not in df.columns:
+            raise ValueError(f"Cannot sweep cleaning thresholds: missing column {col}")
+
+    # fixed rules: removed before the category rule / by any other rule
+    swept = {REASON_USER_CATEGORY, REASON_WEIRD_LOAN}
+    before_category = np.zeros(len(df), dtype=bool)
+    other = np.zeros(len(df), dtype=bool)
+    seen_category = False
+    for rule, mask, _ in _evaluate_rules(raw, df, verbose=False):
+        seen_category |= rule.code == REASON_USER_CATEGORY
+        if rule.code in swept:
+            continue
+        other |= mask
+        if not seen_category:
+            before_category |= mask
+
+    year_codes, years = _year_codes(df)
+    n_years = len(years)
+    total = _count_per_year(year_codes, n_years)
+    removed_other = _count_per_year(year_codes, n_years, other)
+
+    open_days = df["open_days_leihdauer"].to_numpy(dtype="float64")
+    ext = pd.to_numeric(df[EXTENSIONS_COL], errors="coerce").fillna(0).clip(lower=0).to_numpy()
+    not_late = ~df[LATE_COL].to_numpy(dtype=bool)
+    base_values = sorted(base_open_days)
+    bases = np.asarray(base_values, dtype="float64")
+
+    rows = []
+    for categories in remove_categories:
+        categories = sorted(set(categories))
+        category = df[USER_CATEGORY_COL].isin(categories).to_numpy(dtype=bool)
+        removed_category = _count_per_year(year_codes, n_years, category & ~before_category)
+        only_category = _count_per_year(year_codes, n_years, category & ~other)
+
+        candidates = ~other & ~category & not_late & ~np.isnan(open_days) & (year_codes >= 0)
+        cand_years = year_codes[candidates]
+
+        for cap in extensions_caps:
+            ratio = open_days[candidates] / (1 + np.minimum(ext[candidates], cap))
+            # bucket k = number of bases < ratio, i.e. weird for bases[:k]
+            bucket = np.searchsorted(bases, ratio, side="left")
+            counts = np.bincount(
+                cand_years * (len(bases) + 1) + bucket,
+                minlength=n_years * (len(bases) + 1),
+            ).reshape(n_years, len(bases) + 1)
+            weird = counts[:, ::-1].cumsum(axis=1)[:, ::-1][:, 1:]
+
+            for j, base in enumerate(base_values):
+                for y, year in enumerate(years):
+                    removed = removed_other[y] + only_category[y] + weird[y, j]
+                    rows.append(
+                        {
+                            "remove_user_categories": ",".join(categories),
+                            "max_extensions_cap": cap,
+                            "base_allowed_open_days": base,
+                            SOURCE_YEAR_COL: int(year),
+                            "total": int(total[y]),
+                            "removed_user_category": int(removed_category[y]),
+                            "removed_weird_loan": int(weird[y, j]),
+                            "removed_total": int(removed),
+                            "removed_pct": removed / total[y] * 100.0 if total[y] > 0 else 0.0,
+                        }
+                    )
+
+    return pd.DataFrame(rows)
+
+
+def preprocess_borrowings_chunks(
+    chunks: Iterable[pd.DataFrame],
+    *,
+    closed_days: pd.DataFrame | None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Streaming variant of preprocess_borrowings.
+
+    Applies the same (row-local) cleaning steps to each raw chunk and yields the
+    cleaned chunks, so only one chunk is held in memory at a time. Removed rows are
+    only counted (per reason and per year); the per-step and total per-year summaries
+    are printed once all chunks are consumed and match the in-memory run exactly.
+    """
+    start_per_year = pd.Series(dtype="int64")
+    removed_counts = pd.DataFrame(dtype="int64")
+    removed_totals = np.zeros(max(REMOVAL_REASONS) + 1, dtype="int64")
+    n_start = 0
+    n_final = 0
+
+    for chunk in chunks:
+        n_start += len(chunk)
+        start_per_year = start_per_year.add(_count_by_year(chunk), fill_value=0)
+
+        chunk, reasons = _apply_cleaning_steps(chunk, closed_days=closed_days, verbose=False)
+        removed_counts = removed_counts.add(
+            _count_by_reason_and_year(reasons, chunk), fill_value=0
         )
-        print(f"[preprocess] normalized column: {LATE_COL}")
+        removed_totals += np.bincount(reasons, minlength=len(removed_totals))
 
-        if closed_days is not None:
-            df, removed = _remove_weird_loans_using_closed_days(df, closed_days)
-            if not removed.empty:
-                removed_all_steps.append(removed)
-        else:
-            print("[preprocess] skip weird-loan rule: closed_days not provided")
-    else:
-        print(f"[preprocess] skip late normalization + weird-loan rule: missing column {LATE_COL}")
+        clean = _take_kept(chunk, reasons)
+        n_final += len(clean)
+        yield clean
 
-    # final total removed per-year summary (absolute + %)
-    if removed_all_steps:
-        removed_all_df = pd.concat(removed_all_steps, ignore_index=True)
-        _print_total_removed_summary(df_start, removed_all_df)
-    else:
-        print("[preprocess] total removed summary per year: none removed")
+    print(f"[preprocess] start rows: {n_start} (streamed)")
+    removed_counts = removed_counts.fillna(0).sort_index()
+    for code, per_year in removed_counts.iterrows():
+        _print_removed(int(removed_totals[code]), per_year, REMOVAL_REASONS[code])
 
-    print(f"[preprocess] final rows: {len(df)} (removed {n_start - len(df)} total)")
-    return df.reset_index(drop=True)
+    _print_total_removed_counts(start_per_year.sort_index(), removed_counts.sum(axis=0))
+
+    print(f"[preprocess] final rows: {n_final} (removed {n_start - n_final} total)")
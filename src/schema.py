@@ -0,0 +1,157 @@
+# src/schema.py
+from __future__ import annotations
+
+import pandas as pd
+
+from src.config import (
+    MEDIA_TYPE_COL,
+    COLLECTION_CODE_COL,
+    TOPIC_COL,
+    USER_CATEGORY_COL,
+    AUTHOR_COL,
+    TITLE_COL,
+    USER_ID_COL,
+    SOURCE_YEAR_COL,
+    LATE_COL,
+    LATE_FLAG_COL,
+    SESSION_INDEX_COL,
+    SESSION_SIZE_COL,
+    SESSION_LATE_FLAG_COL,
+    SESSION_EXTENSION_FLAG_COL,
+    EXPERIENCE_STAGE_COL,
+    WEEKDAY_COL,
+    HOUR_COL,
+    USER_MODAL_WEEKDAY_COL,
+    USER_MODAL_HOUR_COL,
+    USER_MATCH_TYPICAL_COL,
+    USER_AVG_HOUR_COL,
+    USER_STD_HOUR_COL,
+    USER_N_SESSIONS_COL,
+    USER_N_LOANS_COL,
+    USER_FREQUENT_COL,
+    USER_CATEGORY_DESC_COL,
+    USER_CATEGORY_GROUP_COL,
+    COLLECTION_CODE_DESC_COL,
+    ISSUE_SESSION_COL,
+    SESSION_CATEGORY_COL,
+    SESSION_MEDIA_TIE_COL,
+    SESSION_N_MEDIA_TYPES_COL,
+)
+
+
+# Compact dtypes for the loan-level frame.
+# Nullable types (Int*, boolean) where rows without user id carry no value.
+
+# applied right after loading the raw files
+RAW_SCHEMA: dict[str, str] = {
+    MEDIA_TYPE_COL: "category",
+    COLLECTION_CODE_COL: "category",
+    TOPIC_COL: "category",
+    USER_CATEGORY_COL: "category",
+    AUTHOR_COL: "category",
+    TITLE_COL: "category",
+    USER_ID_COL: "Int32",
+    SOURCE_YEAR_COL: "int16",
+}
+
+# applied after add_features
+FEATURE_SCHEMA: dict[str, str] = {
+    **RAW_SCHEMA,
+    LATE_COL: "bool",
+    LATE_FLAG_COL: "bool",
+    SESSION_INDEX_COL: "Int32",
+    SESSION_SIZE_COL: "Int32",
+    SESSION_LATE_FLAG_COL: "boolean",
+    SESSION_EXTENSION_FLAG_COL: "boolean",
+    EXPERIENCE_STAGE_COL: "category",
+    WEEKDAY_COL: "Int8",
+    HOUR_COL: "Int8",
+    USER_MATCH_TYPICAL_COL: "bool",
+    USER_CATEGORY_DESC_COL: "category",
+    USER_CATEGORY_GROUP_COL: "category",
+    COLLECTION_CODE_DESC_COL: "category",
+}
+
+# user table (features.build_user_table), one row per user
+USER_SCHEMA: dict[str, str] = {
+    USER_ID_COL: "Int32",
+    USER_N_SESSIONS_COL: "int32",
+    USER_N_LOANS_COL: "int32",
+    USER_MODAL_WEEKDAY_COL: "int8",
+    USER_MODAL_HOUR_COL: "int8",
+    USER_AVG_HOUR_COL: "float64",
+    USER_STD_HOUR_COL: "float64",
+    USER_FREQUENT_COL: "bool",
+}
+
+# session table (features.build_session_table), one row per user-session
+SESSION_SCHEMA: dict[str, str] = {
+    USER_ID_COL: "Int32",
+    ISSUE_SESSION_COL: "datetime64[ns]",
+    SOURCE_YEAR_COL: "int16",
+    SESSION_INDEX_COL: "Int32",
+    SESSION_SIZE_COL: "Int32",
+    SESSION_LATE_FLAG_COL: "boolean",
+    SESSION_EXTENSION_FLAG_COL: "boolean",
+    SESSION_CATEGORY_COL: "category",
+    SESSION_MEDIA_TIE_COL: "bool",
+    SESSION_N_MEDIA_TYPES_COL: "int16",
+}
+
+
+def column_bytes(df: pd.DataFrame) -> pd.Series:
+    """
+    Memory usage per column in bytes (deep, i.e. including python string objects).
+    """
+    return df.memory_usage(deep=True, index=False)
+
+
+def _cast_column(s: pd.Series, dtype: str) -> pd.Series:
+    if str(s.dtype) == dtype:
+        return s
+
+    if dtype.startswith(("Int", "int")):
+        s = pd.to_numeric(s, errors="coerce")
+    elif dtype == "bool":
+        s = s.astype("boolean").fillna(False)
+    elif dtype == "boolean" and s.dtype == object:
+        s = s.astype("boolean")
+
+    return s.astype(dtype)
+
+
+def apply_schema(
+    df: pd.DataFrame,
+    schema: dict[str, str],
+    *,
+    report: str | None = None,
+) -> pd.DataFrame:
+    """
+    Cast all columns of df that appear in schema to their compact dtype (in place,
+    df is returned for chaining). Columns missing in df are skipped.
+
+    If report is given, prints bytes per changed column before and after.
+    """
+    before = column_bytes(df) if report is not None else None
+
+    for col, dtype in schema.items():
+        if col in df.columns:
+            df[col] = _cast_column(df[col], dtype)
+
+    if before is not None:
+        _print_memory_report(before, column_bytes(df), report)
+
+    return df
+
+
+def _print_memory_report(before: pd.Series, after: pd.Series, label: str) -> None:
+    changed = before.index[before.ne(after.reindex(before.index))]
+
+    print(f"[schema] memory per column ({label}), MB before -> after:")
+    for col in changed:
+        print(f"  {col}: {before[col] / 1e6:.1f} -> {after[col] / 1e6:.1f}")
+
+    total_before = before.sum() / 1e6
+    total_after = after.sum() / 1e6
+    ratio = (total_before / total_after) if total_after > 0 else float("nan")
+    print(f"  total: {total_before:.1f} -> {total_after:.1f} ({ratio:.1f}x smaller)")
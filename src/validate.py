@@ -10,11 +10,14 @@ from src.config import (
     LATE_COL,
     LATE_FLAG_COL,
     SESSION_INDEX_COL,
+    SESSION_SIZE_COL,
 )
 
-def validate_borrowings(df: pd.DataFrame) -> None:
+def validate_borrowings(df: pd.DataFrame, sessions: pd.DataFrame | None = None) -> None:
     """
     Validate core invariants of the cleaned + feature-enriched borrowings data.
+    sessions (features.build_session_table) is used for the per-user session checks
+    instead of grouping the loans, and checked against the loans itself.
     Raises AssertionError if a violation is detected.
     """
 
@@ -38,11 +41,8 @@ def validate_borrowings(df: pd.DataFrame) -> None:
         assert SESSION_INDEX_COL in df.columns, "session_index missing"
 
         # session_index must start at 1
-        min_idx = (
-            df.loc[has_user]
-            .groupby(USER_ID_COL)[SESSION_INDEX_COL]
-            .min()
-        )
+        per_user = df.loc[has_user] if sessions is None else sessions
+        min_idx = per_user.groupby(USER_ID_COL)[SESSION_INDEX_COL].min()
         assert (min_idx == 1).all(), "session_index does not start at 1 for some users"
 
         # session_index must be integer-like
@@ -50,4 +50,9 @@ def validate_borrowings(df: pd.DataFrame) -> None:
             df.loc[has_user, SESSION_INDEX_COL].dropna() % 1 == 0
         ).all(), "session_index is not integer-valued"
 
+    if sessions is not None:
+        # every loan with a user belongs to exactly one session
+        assert sessions[SESSION_SIZE_COL].sum() == has_user.sum(), "session sizes do not add up to the loans"
+        assert not sessions.duplicated([USER_ID_COL, SESSION_INDEX_COL]).any(), "duplicate user sessions"
+
     print("[validate] all checks passed")
@@ -0,0 +1,95 @@
+import pandas as pd
+
+from src.config import BARCODE_COL, ISSUE_COL, ISSUE_ID_COL, SOURCE_YEAR_COL, USER_ID_COL
+from src import io
+from src.io import (
+    _read_borrowings_file,
+    compute_input_fingerprint,
+    diff_fingerprints,
+    load_processed_version,
+    save_processed,
+    write_parquet_chunks,
+)
+
+
+def _processed_frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            USER_ID_COL: pd.array([1, 2, None, 1], dtype="Int32"),
+            ISSUE_COL: pd.to_datetime(
+                ["2019-03-01 10:00", "2020-05-02 11:30", "2020-06-03 09:15", "2021-01-04 16:45"]
+            ),
+            SOURCE_YEAR_COL: pd.array([2019, 2020, 2020, 2021], dtype="int16"),
+        }
+    )
+
+
+def test_load_ipc_version_with_columns_and_years(tmp_path):
+    save_processed(_processed_frame(), tmp_path / "v1", version="v1", ipc=True)
+
+    columns = [USER_ID_COL, ISSUE_COL]  # without SOURCE_YEAR_COL, like main.required_columns()
+    from_ipc = load_processed_version(tmp_path, "v1", columns=columns, years=[2020])
+    from_parquet = load_processed_version(tmp_path, "v1", columns=columns, years=[2020], use_ipc=False)
+
+    assert list(from_ipc.columns) == columns
+    assert len(from_ipc) == 2
+    pd.testing.assert_frame_equal(
+        from_ipc.sort_values(ISSUE_COL, ignore_index=True),
+        from_parquet.sort_values(ISSUE_COL, ignore_index=True),
+    )
+
+
+def test_pyarrow_engine_keeps_raw_strings(tmp_path):
+    path = tmp_path / "borrowings_2020.csv"
+    path.write_text(
+        f"{ISSUE_ID_COL};{ISSUE_COL};{BARCODE_COL};{USER_ID_COL}\n"
+        "1;2020-01-02 10:00:00;00123;7\n"
+        "2;2020-01-03 11:30:00;;\n"
+    )
+
+    from_c = _read_borrowings_file(path, "c")
+    from_pyarrow = _read_borrowings_file(path, "pyarrow")
+
+    assert from_pyarrow[BARCODE_COL].iloc[0] == "00123"
+    assert from_pyarrow[ISSUE_COL].iloc[0] == "2020-01-02 10:00:00"
+    pd.testing.assert_frame_equal(from_c, from_pyarrow)
+
+
+def test_write_parquet_chunks_with_varying_categoricals(tmp_path):
+    codes = [f"c{i:04d}" for i in range(300)]
+    chunks = [
+        pd.DataFrame({"code": pd.Categorical([None, None]), "n": [0, 1]}),
+        pd.DataFrame({"code": pd.Categorical(codes[:2]), "n": [2, 3]}),
+        # more categories than int8 dictionary indices can address
+        pd.DataFrame({"code": pd.Categorical(codes), "n": range(4, 304)}),
+    ]
+
+    path = tmp_path / "clean.parquet"
+    assert write_parquet_chunks(chunks, path) == 304
+
+    out = pd.read_parquet(path)
+    expected = [None, None] + codes[:2] + codes
+    assert out["code"].astype(object).where(out["code"].notna(), None).tolist() == expected
+
+
+def test_fingerprint_reference_compares_raw_files_by_stats(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    raw_file = raw_dir / "borrowings_2020.csv"
+    raw_file.write_text("a;b\n1;2\n")
+    closed_days = tmp_path / "closed_days.csv"
+    closed_days.write_text("date\n01.01.2020\n")
+    stored = compute_input_fingerprint(raw_dir, closed_days)
+
+    hashed = []
+    sha256 = io.file_sha256
+    monkeypatch.setattr(io, "file_sha256", lambda path: hashed.append(path.name) or sha256(path))
+
+    current = compute_input_fingerprint(raw_dir, closed_days, reference=stored)
+    assert diff_fingerprints(stored, current) == []
+    assert current["combined"] == stored["combined"]
+
+    raw_file.write_text("a;b\n1;2\n3;4\n")
+    current = compute_input_fingerprint(raw_dir, closed_days, reference=stored)
+    assert diff_fingerprints(stored, current) == ["raw_files"]
+    assert raw_file.name not in hashed
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from src.config import BRANCH_COL, CLOSED_DATE_COL
+from src.open_days import build_open_day_calendar
+
+
+def test_loan_branches_match_closed_days_after_stripping():
+    closed_days = pd.DataFrame(
+        {
+            CLOSED_DATE_COL: ["03.03.2020", "04.03.2020", "05.03.2020"],
+            BRANCH_COL: [" Haupt ", "Nord", "Nord"],
+        }
+    )
+    calendar = build_open_day_calendar(closed_days, "2020-03-01", "2020-03-31")
+
+    # Monday 2020-03-02 .. Monday 2020-03-09: 5 open days (weekmask Tue-Sat)
+    start = pd.Series(pd.to_datetime(["2020-03-02"] * 5))
+    end = pd.Series(pd.to_datetime(["2020-03-09"] * 5))
+    branch = pd.Series(["Haupt", "Haupt  ", "Nord", "Sued", None], dtype="category")
+
+    # unknown and missing branches use the pooled calendar (all closed days)
+    np.testing.assert_array_equal(calendar.open_days_between(start, end, branch), [4, 4, 3, 2, 2])
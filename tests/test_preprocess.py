@@ -0,0 +1,16 @@
+import pandas as pd
+
+from src.preprocess import parse_timestamps
+
+
+def test_parse_timestamps_with_mixed_formats_in_one_group():
+    # mostly ISO, with a minority of German-style strings in the same file
+    iso = [f"2020-01-{d:02d} 10:00:00" for d in range(1, 29)]
+    german = ["13.03.2020 08:30", "14.03.2020 09:45"]
+    s = pd.Series(iso + german + [None, "not a date"], name="Ausleihdatum/Uhrzeit")
+
+    out = parse_timestamps(s, groups=pd.Series([2020] * len(s)), verbose=False)
+
+    expected = pd.to_datetime(iso + ["2020-03-13 08:30:00", "2020-03-14 09:45:00"])
+    assert (out.iloc[:30].to_numpy() == expected.to_numpy()).all()
+    assert out.iloc[30:].isna().all()